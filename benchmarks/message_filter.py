@@ -0,0 +1,160 @@
+"""Measures CPU time spent on MESSAGE_CREATE payloads with and without the filter.
+
+Feeds generated gateway payloads through discord.py's connection state into
+the bot's own `on_message`, once with the raw payload filter disabled and
+once with it enabled, and reports CPU time per 10k messages. No connection
+to Discord or the database is made, guild configs are served from the cache
+and command invocation itself is skipped.
+
+Usage, from the repository root:
+
+    python -m benchmarks.message_filter [message count] [command ratio]
+"""
+
+import asyncio
+import random
+import sys
+import time
+import traceback
+
+import discord
+from discord.ext import commands
+
+import bot
+from bot import prefixes
+
+guild_count = 100
+user_id = 633565743103082527
+
+
+class BenchmarkBot(bot.Bot):
+    def __init__(self):
+        commands.AutoShardedBot.__init__(
+            self,
+            command_prefix=self.get_prefix_list,
+            help_command=None,
+            intents=discord.Intents(guilds=True, messages=True),
+            member_cache_flags=discord.MemberCacheFlags.none(),
+            max_messages=None,
+        )
+
+        self.load_extension("bot.ext.config")
+
+        state = self._connection
+        state.user = discord.ClientUser(
+            state=state,
+            data={
+                "id": user_id,
+                "username": "Discohook",
+                "discriminator": "0",
+                "avatar": None,
+            },
+        )
+
+        self.prefixes = prefixes.PrefixMatcher()
+        self.prefixes.set_user(user_id)
+
+        state.shard_count = 1
+
+        for guild_id in range(1, guild_count + 1):
+            state._add_guild_from_data(
+                {
+                    "id": guild_id,
+                    "name": f"Guild {guild_id}",
+                    "member_count": 1,
+                    "roles": [{"id": guild_id, "name": "@everyone", "permissions": 0}],
+                    "channels": [
+                        {
+                            "id": guild_id << 10,
+                            "type": 0,
+                            "name": "general",
+                            "position": 0,
+                            "permission_overwrites": [],
+                        }
+                    ],
+                }
+            )
+
+        # Every guild uses the default config
+        self.get_cog("Config").warmed_at[0] = time.monotonic()
+
+        self.errors = 0
+
+    async def on_error(self, event, *args, **kwargs):
+        if not self.errors:
+            traceback.print_exc()
+
+        self.errors += 1
+
+
+def make_payload(message_id: int, command: bool):
+    guild_id = random.randint(1, guild_count)
+    author_id = random.getrandbits(60)
+
+    return {
+        "id": message_id,
+        "type": 0,
+        "guild_id": str(guild_id),
+        "channel_id": str(guild_id << 10),
+        "content": "d.help" if command else "just chatting " * random.randint(1, 8),
+        "author": {
+            "id": author_id,
+            "username": "user",
+            "discriminator": "0001",
+            "avatar": None,
+            "bot": random.random() < 0.05,
+        },
+        "member": {"roles": [], "joined_at": "2020-01-01T00:00:00+00:00"},
+        "attachments": [],
+        "embeds": [],
+        "mentions": [],
+        "mention_roles": [],
+        "pinned": False,
+        "mention_everyone": False,
+        "tts": False,
+        "timestamp": "2020-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "flags": 0,
+    }
+
+
+async def run(client: BenchmarkBot, payloads):
+    state = client._connection
+
+    started_at = time.process_time()
+    for payload in payloads:
+        state.parse_message_create(payload)
+
+        # Let the dispatched on_message tasks run to completion
+        while len(asyncio.all_tasks()) > 1:
+            await asyncio.sleep(0)
+
+    return time.process_time() - started_at
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    command_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+
+    client = BenchmarkBot()
+    client.invoke = lambda ctx: asyncio.sleep(0)
+
+    payloads = [make_payload(i, random.random() < command_ratio) for i in range(count)]
+
+    print(f"{count} messages, {command_ratio:.2%} commands")
+    for name, enabled in (("unfiltered", False), ("filtered", True)):
+        if enabled:
+            del client.should_parse_message
+        else:
+            client.should_parse_message = None
+
+        client.errors = 0
+        elapsed = client.loop.run_until_complete(run(client, payloads))
+        print(
+            f"{name:>10}: {elapsed / count * 10_000 * 1000:.1f}ms CPU per 10k messages"
+            f", {client.errors} errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
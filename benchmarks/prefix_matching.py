@@ -0,0 +1,93 @@
+"""Compares per-message prefix resolution before and after PrefixMatcher.
+
+The old path built the prefix tuple for every message, checked it with
+`str.startswith` the way discord.py does and ran `re.fullmatch` for the bare
+mention. The new path is one membership test and one precompiled match.
+
+Usage, from the repository root:
+
+    python -m benchmarks.prefix_matching [message count]
+"""
+
+import random
+import re
+import sys
+import timeit
+
+from bot.prefixes import PrefixMatcher
+
+user_id = 633565743103082527
+guild_count = 1000
+
+
+def old(guild_id: int, prefix: str, content: str):
+    if re.fullmatch(rf"<@!?{user_id}>", content):
+        return None
+
+    prefixes = (
+        f"<@!{user_id}> ",
+        f"<@{user_id}> ",
+        f"{prefix} ",
+        prefix,
+    )
+    for candidate in prefixes:
+        if content.startswith(candidate):
+            return candidate
+
+    return None
+
+
+def make_new():
+    matcher = PrefixMatcher()
+    matcher.set_user(user_id)
+
+    def new(guild_id: int, prefix: str, content: str):
+        if matcher.is_mention(content):
+            return None
+
+        return matcher.match(guild_id, prefix, content)
+
+    return new
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    prefixes = {
+        guild_id: "d." if random.random() < 0.9 else random.choice(("!", "?", "dh "))
+        for guild_id in range(guild_count)
+    }
+
+    messages = []
+    for _ in range(count):
+        guild_id = random.randrange(guild_count)
+        content = random.choice(
+            (
+                "just chatting about webhooks",
+                f"{prefixes[guild_id]}help",
+                f"<@!{user_id}> help",
+                f"<@{user_id}>",
+            )
+            if random.random() < 0.01
+            else ("just chatting about webhooks",)
+        )
+        messages.append((guild_id, prefixes[guild_id], content))
+
+    new = make_new()
+    for guild_id, prefix, content in messages:
+        assert old(guild_id, prefix, content) == new(guild_id, prefix, content)
+
+    print(f"{count} messages, {guild_count} guilds")
+    for name, function in (("old", old), ("new", new)):
+        elapsed = min(
+            timeit.repeat(
+                lambda: [function(*message) for message in messages],
+                number=1,
+                repeat=5,
+            )
+        )
+        print(f"{name:>4}: {elapsed / count * 1e9:.0f}ns per message")
+
+
+if __name__ == "__main__":
+    main()
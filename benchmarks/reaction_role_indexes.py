@@ -0,0 +1,193 @@
+"""Measures reaction_role query plans before and after the index migration.
+
+Creates a scratch schema in the database given by `BENCHMARK_DSN`, applies
+every migration before the index migration, seeds it with generated rows and
+reports `EXPLAIN ANALYZE` execution times for the bot's query shapes. The
+index migration is then applied and the same queries are measured again. The
+scratch schema is dropped afterwards. Every guild gets its own roles, as on
+Discord. Timings depend on the server, so the PostgreSQL version and data
+shape are printed with them.
+
+Never point this at the production database.
+
+Usage, from the repository root:
+
+    BENCHMARK_DSN=postgres://... python -m benchmarks.reaction_role_indexes [row count]
+"""
+
+import asyncio
+import json
+import pathlib
+import sys
+from os import environ
+
+import asyncpg
+
+schema = "reaction_role_benchmark"
+migrations = pathlib.Path(__file__).parent.parent / "migrations"
+index_migration = "20261018_1200_add_reaction_role_indexes.sql"
+
+rows_per_guild = 100
+roles_per_guild = 10
+emojis_per_message = 4
+messages_per_channel = 5
+
+queries = {
+    "reaction lookup": (
+        """
+        SELECT role_id FROM reaction_role
+        WHERE message_id = $1 AND emoji_id = $2
+        """,
+        lambda rows: (rows // 2 // emojis_per_message, "1"),
+    ),
+    "guild list": (
+        """
+        SELECT channel_id, message_id, role_id, reaction FROM reaction_role
+        WHERE guild_id = $1
+        ORDER BY message_id
+        """,
+        lambda rows: (rows // 2 // rows_per_guild,),
+    ),
+    "guild count": (
+        """
+        SELECT COUNT(*) FROM reaction_role
+        WHERE guild_id = $1
+        """,
+        lambda rows: (rows // 2 // rows_per_guild,),
+    ),
+    "shard warm-up": (
+        """
+        SELECT message_id, channel_id, guild_id, role_id, emoji_id
+        FROM reaction_role
+        WHERE guild_id = any($1::bigint[])
+        """,
+        lambda rows: (list(range(0, rows // rows_per_guild, 16)),),
+    ),
+    "delete by channel": (
+        """
+        DELETE FROM reaction_role
+        WHERE channel_id = any($1::bigint[])
+        """,
+        lambda rows: ([rows // 2 // emojis_per_message // messages_per_channel],),
+    ),
+    "delete by role": (
+        """
+        DELETE FROM reaction_role
+        WHERE role_id = any($1::bigint[])
+        """,
+        lambda rows: ([rows // 2 // rows_per_guild * roles_per_guild],),
+    ),
+}
+
+
+async def seed(conn: asyncpg.Connection, rows: int):
+    await conn.execute(
+        """
+        INSERT INTO guild_config (guild_id)
+        SELECT guild_id FROM generate_series(0, $1 - 1) guild_id
+        """,
+        rows // rows_per_guild + 1,
+    )
+    await conn.execute(
+        """
+        INSERT INTO reaction_role (
+            message_id, channel_id, guild_id, role_id, reaction, emoji_id
+        )
+        SELECT
+            i / $2,
+            i / $2 / $3,
+            i / $4,
+            i / $4 * $5 + i % $5,
+            (i % $2)::text,
+            (i % $2)::text
+        FROM generate_series(0, $1 - 1) i
+        """,
+        rows,
+        emojis_per_message,
+        messages_per_channel,
+        rows_per_guild,
+        roles_per_guild,
+    )
+    await conn.execute("ANALYZE reaction_role")
+
+
+async def measure(conn: asyncpg.Connection, rows: int, runs: int = 5):
+    results = {}
+
+    for name, (query, make_args) in queries.items():
+        timings = []
+        node_type = None
+
+        for _ in range(runs):
+            transaction = conn.transaction()
+            await transaction.start()
+            try:
+                plan = json.loads(
+                    await conn.fetchval(
+                        f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", *make_args(rows)
+                    )
+                )[0]
+            finally:
+                await transaction.rollback()
+
+            timings.append(plan["Execution Time"])
+            node = plan["Plan"]
+            while node.get("Plans") and node["Node Type"] not in (
+                "Seq Scan",
+                "Index Scan",
+                "Index Only Scan",
+                "Bitmap Heap Scan",
+            ):
+                node = node["Plans"][0]
+            node_type = node["Node Type"]
+
+        results[name] = (sorted(timings)[len(timings) // 2], node_type)
+
+    return results
+
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+
+    conn = await asyncpg.connect(environ["BENCHMARK_DSN"])
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {schema}")
+        await conn.execute(f"SET search_path TO {schema}")
+
+        for migration in sorted(migrations.glob("*.sql")):
+            if migration.name >= index_migration:
+                break
+            await conn.execute(migration.read_text())
+
+        version = await conn.fetchval("SHOW server_version")
+        print(
+            f"PostgreSQL {version}, {rows_per_guild} reaction roles and"
+            f" {roles_per_guild} roles per guild"
+        )
+
+        print(f"Seeding {rows} reaction roles...")
+        await seed(conn, rows)
+
+        before = await measure(conn, rows)
+
+        await conn.execute((migrations / index_migration).read_text())
+        await conn.execute("ANALYZE reaction_role")
+
+        after = await measure(conn, rows)
+
+        print(f"{'query':<20}{'before':>24}{'after':>30}")
+        for name in queries.keys():
+            before_time, before_node = before[name]
+            after_time, after_node = after[name]
+            print(
+                f"{name:<20}{before_time:>10.3f}ms {before_node:<16}"
+                f"{after_time:>10.3f}ms {after_node:<16}"
+            )
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""Compares the old recent message TTLCache to snowflake timestamp checks.
+
+Simulates a stream of message creates followed by reactions on a sample of
+those messages, and reports CPU time and peak memory for both approaches.
+
+Usage, from the repository root:
+
+    python -m benchmarks.recent_messages [message count]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+
+import cachetools
+import discord
+
+from bot.ext.roles import is_recent
+
+
+def make_snowflake(timestamp_ms: int):
+    return ((timestamp_ms - discord.utils.DISCORD_EPOCH) << 22) | random.getrandbits(22)
+
+
+def run_cache(message_ids, reaction_ids):
+    cache = cachetools.TTLCache(maxsize=float("inf"), ttl=300)
+
+    for message_id in message_ids:
+        cache[message_id] = True
+
+    return sum(1 for message_id in reaction_ids if message_id in cache)
+
+
+def run_snowflake(message_ids, reaction_ids):
+    # Nothing is stored per message, the ID alone tells its age
+    return sum(1 for message_id in reaction_ids if is_recent(message_id, 300))
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    started_at = time.process_time()
+    result = function(*args)
+    elapsed = time.process_time() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    now = int(time.time() * 1000)
+    message_ids = [
+        make_snowflake(now - random.randrange(300_000)) for _ in range(count)
+    ]
+    reaction_ids = random.sample(message_ids, count // 10)
+
+    print(f"{count} messages, {len(reaction_ids)} reactions")
+    for name, function in (
+        ("TTLCache", run_cache),
+        ("snowflake", run_snowflake),
+    ):
+        result, elapsed, peak = measure(function, message_ids, reaction_ids)
+        print(
+            f"{name:>10}: {elapsed:.3f}s CPU, {peak / 1024 / 1024:.1f} MiB peak,"
+            f" {result} reactions ignored"
+        )
+
+
+if __name__ == "__main__":
+    main()
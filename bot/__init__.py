@@ -1,4 +1,6 @@
-import re
+import asyncio
+import collections
+import time
 from os import environ
 
 import aiohttp
@@ -8,7 +10,7 @@ from discord.ext import commands
 from discord.utils import get
 
 import bot.patches
-from bot import cmd
+from bot import cmd, identify, invalidation, prefixes, queries, sessions, workers
 from bot.ext import config
 from bot.utils import wrap_in_code
 
@@ -24,9 +26,15 @@ initial_extensions = (
     "bot.ext.roles",
 )
 
+worker_extensions = (
+    "bot.ext.config",
+    "bot.ext.errors",
+    "bot.ext.roles",
+)
+
 
 class Bot(commands.AutoShardedBot):
-    def __init__(self):
+    def __init__(self, *, cluster=None, forwarder=None, worker_id=None, **options):
         super().__init__(
             command_prefix=self.get_prefix_list,
             description="Discohook's official bot.",
@@ -47,32 +55,119 @@ class Bot(commands.AutoShardedBot):
             member_cache_flags=discord.MemberCacheFlags.none(),
             max_messages=None,
             guild_subscriptions=False,
+            **options,
         )
 
+        self.cluster = cluster
+        if cluster:
+            cluster.attach(self)
+
+        self.forwarder = forwarder
+        if forwarder:
+            forwarder.attach(self)
+
+        self.worker_id = worker_id
+
+        self.gateway_sessions = None
+        if worker_id is None and environ.get("RESUME_SESSIONS") == "true":
+            self.gateway_sessions = sessions.SessionStore(self)
+
+        self.identify_buckets = identify.IdentifyBuckets()
+        self.prefixes = prefixes.PrefixMatcher()
         self.add_check(self.global_check)
 
-        for extension in initial_extensions:
+        extensions = initial_extensions if worker_id is None else worker_extensions
+        for extension in extensions:
             self.load_extension(extension)
 
     async def start(self, *args, **kwargs):
+        await self.start_services()
+        await super().start(*args, **kwargs)
+
+    async def start_worker(self, token, queue):
+        await self.start_services()
+        await self.login(token)
+        await workers.consume(self, queue)
+
+    async def start_services(self):
         self.session = aiohttp.ClientSession()
         self.pool = await asyncpg.create_pool(dsn=environ.get("DATABASE_DSN"))
-        await super().start(*args, **kwargs)
+        self.queries = queries.Queries(self.pool)
+        self.invalidator = invalidation.CacheInvalidator(
+            self, environ.get("DATABASE_DSN")
+        )
+        await self.invalidator.start()
 
     async def close(self):
+        if self.gateway_sessions and not self.is_closed():
+            await self.gateway_sessions.save()
+
+        # Cogs are only unloaded by super().close(), after the pool is gone
+        roles = self.get_cog("Roles")
+        if roles:
+            await roles.flush_deletes()
+
         await self.session.close()
+        await self.invalidator.close()
         await self.pool.close()
         await super().close()
 
-    async def get_prefix_list(self, bot, message):
+    def should_parse_message(self, data):
+        """Decides from a raw MESSAGE_CREATE payload if it can be a command
+
+        Payloads that are dropped here never become a Message object, so this
+        errs towards letting them through whenever something else could care.
+        """
+
+        if self._listeners.get("message") or self.extra_events.get("on_message"):
+            return True
+
+        if data["author"].get("bot"):
+            return False
+
+        content = data.get("content", "")
+        if content.startswith((f"<@{self.user.id}>", f"<@!{self.user.id}>")):
+            return True
+
         cfg = self.get_cog("Config")
+        guild_id = data.get("guild_id")
+        if cfg is None or guild_id is None:
+            return True
+
+        # Shards that resumed a saved session have no guild state yet
+        guild = self._connection._get_guild(int(guild_id))
+        if guild is None:
+            return False
+
+        config = cfg.get_cached(guild)
+        if config is None:
+            return True
+
+        return content.startswith(config["prefix"])
+
+    async def get_guild_prefix(self, message):
+        if not message.guild:
+            return config.defaults["prefix"]
+
+        return await self.get_cog("Config").get_value(
+            message.guild, get(config.configurables, name="prefix")
+        )
 
-        prefix = (
-            await cfg.get_value(message.guild, get(config.configurables, name="prefix"))
-            if message.guild
-            else "d."
+    async def match_prefix(self, message):
+        prefix = await self.get_guild_prefix(message)
+        return self.prefixes.match(
+            message.guild and message.guild.id, prefix, message.content
         )
 
+    async def get_prefix_list(self, bot, message):
+        prefix = await self.get_guild_prefix(message)
+        match = self.prefixes.match(
+            message.guild and message.guild.id, prefix, message.content
+        )
+        if match:
+            return (match,)
+
+        # discord.py rejects an empty prefix list
         return (
             f"<@!{bot.user.id}> ",
             f"<@{bot.user.id}> ",
@@ -89,34 +184,91 @@ class Bot(commands.AutoShardedBot):
 
         return True
 
+    async def take_resume_session(self, shard_id):
+        if self.gateway_sessions:
+            return await self.gateway_sessions.take(shard_id)
+
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        if self.gateway_sessions and self.gateway_sessions.consume_identify(shard_id):
+            return
+
+        if self.cluster is None:
+            await self.identify_buckets.wait(shard_id)
+        else:
+            await self.cluster.wait_identify(shard_id)
+
+    async def launch_shards(self):
+        data = await self.http.request(discord.http.Route("GET", "/gateway/bot"))
+        if self.shard_count is None:
+            self.shard_count = data["shards"]
+        gateway = await self.http.get_gateway()
+
+        max_concurrency = data["session_start_limit"]["max_concurrency"]
+        self.identify_buckets.max_concurrency = max_concurrency
+
+        self._connection.shard_count = self.shard_count
+        shard_ids = self.shard_ids or range(self.shard_count)
+        self._connection.shard_ids = shard_ids
+
+        buckets = collections.defaultdict(list)
+        for shard_id in shard_ids:
+            buckets[shard_id % max_concurrency].append(shard_id)
+
+        await asyncio.gather(
+            *(
+                self.launch_bucket(gateway, bucket, bucket_shard_ids)
+                for bucket, bucket_shard_ids in buckets.items()
+            )
+        )
+
+        self._connection.shards_launched.set()
+
+    async def launch_bucket(self, gateway, bucket, shard_ids):
+        started_at = time.monotonic()
+
+        for shard_id in shard_ids:
+            await self.launch_shard(gateway, shard_id)
+
+        print(
+            f"Launched {len(shard_ids)} shards in identify bucket {bucket}"
+            f" in {time.monotonic() - started_at:.1f}s"
+        )
+
     async def on_ready(self):
         print(f"Ready as {self.user} ({self.user.id})")
 
+    async def on_connect(self):
+        self.prefixes.set_user(self.user.id)
+
     async def on_message(self, message):
         if message.author.bot:
             return
 
-        ctx = await self.get_context(message, cls=cmd.Context)
-        cfg = self.get_cog("Config")
+        if self.prefixes.is_mention(message.content):
+            await self.send_prefix(message)
+            return
+
+        if await self.match_prefix(message) is None:
+            return
 
-        if re.fullmatch(rf"<@!?{self.user.id}>", message.content):
-            embed = discord.Embed(title="Prefix", description="My prefix is `d.`.")
+        ctx = await self.get_context(message, cls=cmd.Context)
+        await self.invoke(ctx)
 
-            if message.guild:
-                try:
-                    await self.global_check(ctx)
-                except commands.BotMissingPermissions as error:
-                    await self.get_cog("Errors").on_command_error(ctx, error)
-                    return
+    async def send_prefix(self, message):
+        embed = discord.Embed(title="Prefix", description="My prefix is `d.`.")
 
-                prefix = await cfg.get_value(
-                    message.guild, get(config.configurables, name="prefix")
-                )
-                embed.description = f"My prefix is {wrap_in_code(prefix)}."
+        if message.guild:
+            ctx = await self.get_context(message, cls=cmd.Context)
+            try:
+                await self.global_check(ctx)
+            except commands.BotMissingPermissions as error:
+                await self.get_cog("Errors").on_command_error(ctx, error)
+                return
 
-            await message.channel.send(embed=embed)
+            prefix = await self.get_guild_prefix(message)
+            embed.description = f"My prefix is {wrap_in_code(prefix)}."
 
-        await self.invoke(ctx)
+        await message.channel.send(embed=embed)
 
     async def on_error(self, event, *args, **kwargs):
         errors = self.get_cog("Errors")
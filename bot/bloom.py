@@ -0,0 +1,68 @@
+import math
+
+_mask = (1 << 64) - 1
+
+
+def _mix(value: int):
+    value = (value + 0x9E3779B97F4A7C15) & _mask
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _mask
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _mask
+    return value ^ (value >> 31)
+
+
+class BloomFilter:
+    """Compact probabilistic set of integer IDs.
+
+    Membership tests can return false positives at roughly `error_rate` while
+    `capacity` is not exceeded, but never false negatives. Items cannot be
+    removed, build a new filter instead.
+    """
+
+    def __init__(self, capacity: int, *, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+
+        self.size = math.ceil(
+            -self.capacity * math.log(error_rate) / (math.log(2) ** 2)
+        )
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _probes(self, item: int):
+        first = _mix(item)
+        second = _mix(first) | 1
+
+        for index in range(self.hash_count):
+            yield (first + index * second) % self.size
+
+    def add(self, item: int):
+        for bit in self._probes(item):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+
+        self.count += 1
+
+    def __contains__(self, item: int):
+        for bit in self._probes(item):
+            if not self.bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def false_positive_rate(self):
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** (
+            self.hash_count
+        )
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "count": self.count,
+            "size_bytes": len(self.bits),
+            "hash_count": self.hash_count,
+            "false_positive_rate": self.false_positive_rate,
+        }
@@ -0,0 +1,266 @@
+import asyncio
+import math
+import multiprocessing
+import queue
+import time
+
+import aiohttp
+import discord
+
+from bot import identify
+
+
+async def get_gateway_bot(token: str):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{discord.http.Route.BASE}/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+def split_shards(shard_count: int, cluster_count: int):
+    size = math.ceil(shard_count / cluster_count)
+    return [
+        range(start, min(start + size, shard_count))
+        for start in range(0, shard_count, size)
+    ]
+
+
+class ClusterLink:
+    """Worker side of a cluster's connection to the supervisor.
+
+    Identifies are requested from the supervisor, which paces them per
+    identify bucket across every cluster. Shard events are reported back as
+    status.
+    """
+
+    def __init__(
+        self, cluster_id: int, shard_ids: range, events, grants, worker_queues
+    ):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.events = events
+        self.grants = grants
+        self.worker_queues = worker_queues
+
+        self.requests = 0
+        self.waiters = {}
+        self.reading = False
+
+    def attach(self, bot: discord.AutoShardedClient):
+        self.bot = bot
+
+        for event in ("connect", "ready", "disconnect", "resumed"):
+            bot.add_listener(self.on_shard_event(event), f"on_shard_{event}")
+
+    def on_shard_event(self, event: str):
+        async def listener(shard_id: int):
+            self.report(f"shard {shard_id} {event}")
+
+        return listener
+
+    def report(self, event: str):
+        self.events.put(
+            (
+                self.cluster_id,
+                "status",
+                {
+                    "event": event,
+                    "guilds": len(self.bot.guilds),
+                    "shards": {
+                        shard_id: None if shard.is_closed() else shard.latency
+                        for shard_id, shard in self.bot.shards.items()
+                    },
+                },
+            )
+        )
+
+    async def wait_identify(self, shard_id: int):
+        loop = asyncio.get_running_loop()
+        if not self.reading:
+            loop.add_reader(self.grants.fileno(), self.on_grant)
+            self.reading = True
+
+        self.requests += 1
+        request = self.requests
+        waiter = self.waiters[request] = loop.create_future()
+
+        self.events.put((self.cluster_id, "identify", (request, shard_id)))
+        try:
+            await waiter
+        finally:
+            del self.waiters[request]
+
+    def on_grant(self):
+        # Grants for requests that timed out on our side are dropped
+        waiter = self.waiters.get(self.grants.recv())
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class Supervisor:
+    """Runs clusters and workers in their own processes and restarts them.
+
+    `target(cluster_id, shard_ids, shard_count, link)` runs in each cluster
+    process. With `worker_count` set, `worker_target(worker_id, queue)` runs
+    in each worker process and clusters forward events to the workers'
+    queues, see `bot.workers`. Identify requests are granted in arrival
+    order within each `shard_id % max_concurrency` bucket, with buckets
+    shared by all clusters.
+    """
+
+    restart_backoff = (1.0, 60.0)
+    stable_after = 60.0
+
+    def __init__(
+        self,
+        target,
+        shard_count: int,
+        cluster_count: int,
+        *,
+        worker_target=None,
+        worker_count: int = 0,
+        max_concurrency: int = 1,
+    ):
+        self.target = target
+        self.worker_target = worker_target
+        self.shard_count = shard_count
+        self.clusters = dict(enumerate(split_shards(shard_count, cluster_count)))
+
+        self.context = multiprocessing.get_context("spawn")
+        self.events = self.context.Queue()
+        self.worker_queues = [self.context.Queue() for _ in range(worker_count)]
+
+        self.processes = {}
+        self.grants = {}
+        self.started_at = {}
+        self.backoff = {}
+        self.restart_at = {}
+        self.statuses = {}
+
+        self.pending_identifies = []
+        self.identify_buckets = identify.IdentifyBuckets(max_concurrency)
+
+    def start(self, key):
+        kind, index = key
+
+        if kind == "cluster":
+            shard_ids = self.clusters[index]
+            receiver, sender = self.context.Pipe(duplex=False)
+            link = ClusterLink(
+                index, shard_ids, self.events, receiver, self.worker_queues
+            )
+
+            target = self.target
+            args = (index, shard_ids, self.shard_count, link)
+            description = f"shards {shard_ids.start}..{shard_ids.stop - 1}"
+        else:
+            target = self.worker_target
+            args = (index, self.worker_queues[index])
+            description = f"guild_id % {len(self.worker_queues)} == {index}"
+
+        process = self.context.Process(target=target, args=args, name=f"{kind}-{index}")
+        process.start()
+
+        if kind == "cluster":
+            receiver.close()
+            self.grants[index] = sender
+
+        self.processes[key] = process
+        self.started_at[key] = time.monotonic()
+
+        print(f"Started {kind} {index} ({description}, pid {process.pid})")
+
+    def check_processes(self):
+        now = time.monotonic()
+
+        for key, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+
+            kind, index = key
+            del self.processes[key]
+
+            if kind == "cluster":
+                self.grants.pop(index).close()
+                self.statuses.pop(index, None)
+                self.pending_identifies = [
+                    pending
+                    for pending in self.pending_identifies
+                    if pending[0] != index
+                ]
+
+            minimum, maximum = self.restart_backoff
+            if now - self.started_at[key] > self.stable_after:
+                self.backoff[key] = minimum
+            else:
+                self.backoff[key] = min(self.backoff.get(key, minimum / 2) * 2, maximum)
+
+            self.restart_at[key] = now + self.backoff[key]
+            print(
+                f"{kind.capitalize()} {index} exited with code {process.exitcode},"
+                f" restarting in {self.backoff[key]:.0f}s"
+            )
+
+        for key, restart_at in list(self.restart_at.items()):
+            if now >= restart_at:
+                del self.restart_at[key]
+                self.start(key)
+
+    def grant_identify(self):
+        now = time.monotonic()
+        buckets = self.identify_buckets
+        remaining = []
+
+        for cluster_id, request, shard_id in self.pending_identifies:
+            bucket = buckets.bucket(shard_id)
+            if buckets.ready_in(bucket, now) > 0 or cluster_id not in self.grants:
+                remaining.append((cluster_id, request, shard_id))
+                continue
+
+            try:
+                self.grants[cluster_id].send(request)
+            except OSError:
+                continue
+
+            buckets.take(bucket, now)
+
+        self.pending_identifies = remaining
+
+    def handle(self, cluster_id: int, kind: str, payload):
+        if kind == "identify":
+            self.pending_identifies.append((cluster_id, *payload))
+        elif kind == "status":
+            self.statuses[cluster_id] = payload
+
+            connected = sum(
+                latency is not None for latency in payload["shards"].values()
+            )
+            print(
+                f"Cluster {cluster_id}: {payload['event']},"
+                f" {connected}/{len(self.clusters[cluster_id])} shards connected,"
+                f" {payload['guilds']} guilds"
+            )
+
+    def run(self):
+        for cluster_id in self.clusters.keys():
+            self.start(("cluster", cluster_id))
+        for worker_id in range(len(self.worker_queues)):
+            self.start(("worker", worker_id))
+
+        try:
+            while True:
+                try:
+                    self.handle(*self.events.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+
+                self.grant_identify()
+                self.check_processes()
+        finally:
+            for process in self.processes.values():
+                process.terminate()
+            for process in self.processes.values():
+                process.join()
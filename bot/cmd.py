@@ -16,6 +16,10 @@ class Cog(commands.Cog):
     def db(self):
         return self.bot.pool
 
+    @property
+    def queries(self):
+        return self.bot.queries
+
     @property
     def cfg(self):
         return self.bot.get_cog("Config")
@@ -0,0 +1,68 @@
+import gzip
+import json
+
+
+class Parts:
+    """File object that cuts everything written to it into fixed size parts"""
+
+    def __init__(self, part_size: int):
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.done = []
+
+    def write(self, data: bytes):
+        self.buffer += data
+
+        while len(self.buffer) >= self.part_size:
+            self.done.append(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        if self.buffer:
+            self.done.append(bytes(self.buffer))
+            self.buffer.clear()
+
+    def take(self):
+        done, self.done = self.done, []
+        return done
+
+
+class DumpWriter:
+    """Writes a JSON document with one streamed list as gzip, split into parts.
+
+    The document is written as a header, any number of row batches, and a
+    closing call. Compression blocks, so these are meant to run in an
+    executor. Finished parts of at most `part_size` bytes are collected with
+    `take_parts`.
+    """
+
+    def __init__(self, part_size: int):
+        self.parts = Parts(part_size)
+        self.file = gzip.GzipFile(fileobj=self.parts, mode="wb")
+        self.rows = 0
+
+    def write_header(self, document: dict, key: str):
+        header = json.dumps(document)[:-1]
+        if document:
+            header += ", "
+
+        self.file.write(f"{header}{json.dumps(key)}: [".encode())
+
+    def write_rows(self, rows):
+        for row in rows:
+            separator = ",\n" if self.rows else "\n"
+            self.file.write(f"{separator}{json.dumps(row)}".encode())
+            self.rows += 1
+
+    def close(self):
+        self.file.write(b"\n]}\n")
+        self.file.close()
+        self.parts.finish()
+
+    def take_parts(self):
+        return self.parts.take()
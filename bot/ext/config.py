@@ -1,17 +1,19 @@
 import asyncio
 import collections
+import math
+import time
+import types
 from os import environ
 
 import asyncpg
-import cachetools
 import discord
-from bot import cmd
+from bot import cmd, queries
 from discord.ext import commands
 from discord.utils import get
 
 Configurable = collections.namedtuple(
     "Configurable",
-    "name description column type",
+    "name description column type default",
 )
 
 
@@ -21,15 +23,33 @@ configurables = [
         description="Prefix specific to server, mention prefix will always work.",
         column="prefix",
         type=str,
+        default="d.",
     ),
     Configurable(
         name="private",
         description="Make certain sensitive commands private to server moderators.",
         column="sensitive",
         type=bool,
+        default=False,
     ),
 ]
 
+defaults = types.MappingProxyType(
+    {configurable.column: configurable.default for configurable in configurables}
+)
+
+
+for configurable in configurables:
+    queries.register(
+        f"guild_config.set_{configurable.column}",
+        f"""
+        INSERT INTO guild_config (guild_id, {configurable.column})
+        VALUES ($1::bigint, $2)
+        ON CONFLICT (guild_id) DO UPDATE
+        SET {configurable.column} = EXCLUDED.{configurable.column}
+        """,
+    )
+
 
 type_names = {
     str: "string",
@@ -58,38 +78,166 @@ def resolve_value(expected_type, user_input: str):
 class Config(cmd.Cog):
     """State management for the bot"""
 
+    ttl = 21600
+    refresh_after = 3600
+    warm_up_chunk_size = 1000
+    warm_up_interval = 0.25
+
     def __init__(self, bot):
         super().__init__(bot)
 
-        self.cache = cachetools.TTLCache(maxsize=float("inf"), ttl=900)
+        # Only guilds with settings that differ from the defaults are cached,
+        # every other guild shares `defaults`. Guilds loaded on their own keep
+        # a loaded_at entry either way, warmed up default guilds don't
+        self.cache = {}
+        self.loaded_at = {}
+        self.loading = {}
+        self.warmed_at = {}
+        self.warming = {}
+
+    def store(
+        self,
+        guild_id: int,
+        row,
+        *,
+        loaded_at: float = None,
+        remember_default: bool = True,
+    ):
+        config = defaults
+        if row is not None:
+            config = {column: row[column] for column in defaults.keys()}
+
+        if loaded_at is None:
+            loaded_at = time.monotonic()
+
+        if config == defaults:
+            self.cache.pop(guild_id, None)
+            if remember_default:
+                self.loaded_at[guild_id] = loaded_at
+            else:
+                self.loaded_at.pop(guild_id, None)
+            return defaults
+
+        self.cache[guild_id] = config
+        self.loaded_at[guild_id] = loaded_at
+        return config
+
+    async def _load(self, guild_id: int):
+        started_at = time.monotonic()
+
+        row = await self.queries.fetchrow("guild_config.get", guild_id)
+
+        # Keep values written by set_value while this load was in flight
+        if self.loaded_at.get(guild_id, -math.inf) < started_at:
+            return self.store(guild_id, row, loaded_at=started_at)
+
+        return self.cache.get(guild_id, defaults)
+
+    def load(self, guild_id: int):
+        task = self.loading.get(guild_id)
+        if task:
+            return task
+
+        def done(task):
+            del self.loading[guild_id]
+            if not task.cancelled():
+                task.exception()
+
+        task = self.loading[guild_id] = self.loop.create_task(self._load(guild_id))
+        task.add_done_callback(done)
+        return task
+
+    def get_cached(self, guild: discord.Guild):
+        """Returns the guild's config if it is known without loading it"""
+
+        if guild.id in self.loaded_at:
+            return self.cache.get(guild.id, defaults)
+
+        if guild.shard_id in self.warmed_at and guild.id not in self.loading:
+            return defaults
 
     async def ensure(self, guild: discord.Guild):
-        try:
-            return self.cache[guild.id]
-        except KeyError:
-            pass
-
-        row = await self.db.fetchrow(
-            """
-            SELECT * FROM guild_config
-            WHERE guild_id = $1
-            """,
-            guild.id,
+        # A stale warm up is refreshed for this guild only, which then keeps
+        # its own loaded_at entry
+        if guild.id in self.loaded_at:
+            config = self.cache.get(guild.id, defaults)
+            age = time.monotonic() - self.loaded_at[guild.id]
+        elif guild.shard_id in self.warmed_at and guild.id not in self.loading:
+            config = defaults
+            age = time.monotonic() - self.warmed_at[guild.shard_id]
+        else:
+            return await asyncio.shield(self.load(guild.id))
+
+        if age < self.refresh_after:
+            return config
+        if age < self.ttl:
+            self.load(guild.id)
+            return config
+
+        return await asyncio.shield(self.load(guild.id))
+
+    async def warm_up(self, guild_ids, started_at: float):
+        for index in range(0, len(guild_ids), self.warm_up_chunk_size):
+            chunk = guild_ids[index : index + self.warm_up_chunk_size]
+
+            rows = {
+                row["guild_id"]: row
+                for row in await self.queries.fetch(
+                    "guild_config.list_for_guilds", chunk
+                )
+            }
+
+            for guild_id in chunk:
+                if self.loaded_at.get(guild_id, -math.inf) < started_at:
+                    self.store(
+                        guild_id,
+                        rows.get(guild_id),
+                        loaded_at=started_at,
+                        remember_default=False,
+                    )
+
+            await asyncio.sleep(self.warm_up_interval)
+
+    async def _warm_up_shard(self, shard_id: int):
+        started_at = time.monotonic()
+
+        await self.warm_up(
+            [guild.id for guild in self.bot.guilds if guild.shard_id == shard_id],
+            started_at,
         )
-        if row:
-            self.cache[guild.id] = dict(row)
-            return await self.ensure(guild)
-
-        await self.db.execute(
-            """
-            INSERT INTO guild_config (guild_id)
-            VALUES ($1)
-            ON CONFLICT DO NOTHING
-            """,
-            guild.id,
+
+        self.warmed_at[shard_id] = started_at
+
+    def warm_up_shard(self, shard_id: int):
+        task = self.warming.get(shard_id)
+        if task:
+            return task
+
+        def done(task):
+            del self.warming[shard_id]
+            if not task.cancelled():
+                task.exception()
+
+        task = self.warming[shard_id] = self.loop.create_task(
+            self._warm_up_shard(shard_id)
         )
+        task.add_done_callback(done)
+        return task
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        await self.warm_up_shard(shard_id)
 
-        return await self.ensure(guild)
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        # Guilds that were not part of their shard's warm up
+        await self.load(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.cache.pop(guild.id, None)
+        self.loaded_at.pop(guild.id, None)
+        self.bot.prefixes.invalidate(guild.id)
 
     async def get_value(
         self,
@@ -107,28 +255,41 @@ class Config(cmd.Cog):
     ):
         config = await self.ensure(guild)
 
-        config[configurable.column] = new_value
-
-        await self.db.execute(
-            f"""
-            UPDATE guild_config
-            SET {configurable.column} = $2
-            WHERE guild_id = $1
-            """,
+        await self.queries.execute(
+            f"guild_config.set_{configurable.column}",
             guild.id,
             new_value,
         )
 
+        self.store(guild.id, {**config, configurable.column: new_value})
+        await self.bot.invalidator.publish("guild_config", guild.id)
+
     async def delete_data(self, guild: discord.Guild):
-        await self.db.execute(
-            f"""
-            DELETE FROM guild_config
-            WHERE guild_id = $1
-            """,
-            guild.id,
-        )
+        await self.queries.execute("guild_config.delete", guild.id)
+
+        self.cache.pop(guild.id, None)
+        self.loaded_at.pop(guild.id, None)
+        self.bot.prefixes.invalidate(guild.id)
+        await self.bot.invalidator.publish("guild_config", guild.id)
+
+    @commands.Cog.listener()
+    async def on_cache_invalidate(self, kind: str, key: int):
+        if kind == "all":
+            self.cache.clear()
+            self.loaded_at.clear()
+            self.warmed_at.clear()
+            self.bot.prefixes.invalidate()
+
+            for shard_id in self.bot.shards:
+                self.warm_up_shard(shard_id)
+        elif kind == "guild_config":
+            self.cache.pop(key, None)
+            self.loaded_at.pop(key, None)
+            self.bot.prefixes.invalidate(key)
 
-        del self.cache[guild.id]
+            # Guilds that aren't cached would otherwise resolve to defaults
+            if self.bot.get_guild(key):
+                await self.load(key)
 
 
 def setup(bot: commands.Bot):
@@ -1,19 +1,31 @@
 import asyncio
+import functools
 import io
-import json
 import typing
 
 import discord
-from bot import cmd, menus
+from bot import cmd, dump, menus
 from bot.ext import config
 from bot.utils import get_clean_prefix, wrap_in_code
 from discord.ext import commands
 from discord.utils import get
 
 
+def format_stats(stats: dict):
+    lines = (
+        f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}"
+        for name, value in stats.items()
+    )
+    return wrap_in_code("\n".join(lines), block="yaml")
+
+
 class Meta(cmd.Cog):
     """Commands related to the bot itself"""
 
+    dump_part_size = 8_000_000
+    dump_batch_size = 500
+    stats_statements = 8
+
     @commands.group(invoke_without_command=True)
     @commands.cooldown(3, 8, commands.BucketType.channel)
     @commands.guild_only()
@@ -119,6 +131,46 @@ class Meta(cmd.Cog):
 
         await ctx.prompt(embed=embed)
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def stats(self, ctx: cmd.Context):
+        """Shows internal statistics of this process"""
+
+        embed = discord.Embed(title="Stats")
+
+        roles = self.bot.get_cog("Roles")
+        if roles:
+            embed.add_field(
+                name="Role scheduler",
+                value=format_stats(roles.scheduler.stats()),
+                inline=False,
+            )
+            if roles.filter is not None:
+                embed.add_field(
+                    name="Reaction role filter",
+                    value=format_stats(roles.filter.stats()),
+                    inline=False,
+                )
+
+        # Sorted by total time, the slowest statements come first
+        statements = list(self.queries.get_stats().items())[: self.stats_statements]
+        if statements:
+            embed.add_field(
+                name="Statements",
+                value=format_stats(
+                    {
+                        name: f"{stats['calls']} calls,"
+                        f" {stats['average_time'] * 1000:.1f}ms avg,"
+                        f" {stats['max_time'] * 1000:.1f}ms max,"
+                        f" {stats['errors']} errors"
+                        for name, stats in statements
+                    }
+                ),
+                inline=False,
+            )
+
+        await ctx.prompt(embed=embed)
+
     @commands.command()
     @commands.cooldown(3, 8, commands.BucketType.channel)
     async def invite(self, ctx: cmd.Context):
@@ -195,33 +247,13 @@ class Meta(cmd.Cog):
     async def dump(self, ctx: cmd.Context):
         """Dumps all data stored by this bot"""
 
-        config = dict(await self.cfg.ensure(ctx.guild))
-
-        reaction_roles = await self.db.fetch(
-            """
-            SELECT * FROM reaction_role
-            WHERE guild_id = $1
-            """,
-            ctx.guild.id,
-        )
-        config["reaction_roles"] = [dict(row) for row in reaction_roles]
-
-        fp = io.StringIO()
-        json.dump(config, fp, indent=2)
-        fp.seek(0)
+        config = {"guild_id": ctx.guild.id, **await self.cfg.ensure(ctx.guild)}
 
         try:
             await ctx.author.send(
                 embed=discord.Embed(
                     title="Data dump",
                     description=f"Data dump requested inside of {ctx.guild}.",
-                ),
-                file=discord.File(fp, filename=f"{ctx.guild.id}.json"),
-            )
-            await ctx.channel.send(
-                embed=discord.Embed(
-                    title="Data dump sent",
-                    description="Please check your DMs.",
                 )
             )
         except discord.Forbidden:
@@ -231,6 +263,48 @@ class Meta(cmd.Cog):
                     description="Could not send DM, check server privacy settings or unblock me.",
                 )
             )
+            return
+
+        writer = dump.DumpWriter(self.dump_part_size)
+        run = functools.partial(self.loop.run_in_executor, None)
+
+        await run(writer.write_header, config, "reaction_roles")
+
+        # Parts are only sent once the transaction is closed, so slow DMs never
+        # hold a connection. A guild has at most a few hundred rows
+        async with self.db.acquire() as conn, conn.transaction():
+            cursor = await self.queries.cursor(
+                "reaction_role.list_for_guild", ctx.guild.id, conn=conn
+            )
+
+            while rows := await cursor.fetch(self.dump_batch_size):
+                await run(writer.write_rows, [dict(row) for row in rows])
+
+        await run(writer.close)
+
+        parts = writer.take_parts()
+        for index, part in enumerate(parts, start=1):
+            filename = f"{ctx.guild.id}.json.gz"
+            if len(parts) > 1:
+                filename += f".part{index}"
+
+            await ctx.author.send(
+                file=discord.File(io.BytesIO(part), filename=filename)
+            )
+
+        description = "Please check your DMs."
+        if len(parts) > 1:
+            description += (
+                f" The dump was split into {len(parts)} parts, join them in"
+                " order to get the complete file."
+            )
+
+        await ctx.channel.send(
+            embed=discord.Embed(
+                title="Data dump sent",
+                description=description,
+            )
+        )
 
 
 def setup(bot: commands.Bot):
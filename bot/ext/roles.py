@@ -1,25 +1,475 @@
 import asyncio
+import collections
+import csv
+import functools
+import io
 import itertools
+import json
 import math
 import re
+import time
+import zlib
 from typing import Union
 
+import asyncpg
 import cachetools
 import discord
-from bot import cmd, converter, menus
+from bot import bloom, cmd, converter, menus, scheduler
 from bot.utils import get_command_signature, wrap_in_code
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.utils import get
 
 
+def is_recent(snowflake: int, seconds: float):
+    created_at = (snowflake >> 22) + discord.utils.DISCORD_EPOCH
+    return time.time() * 1000 - created_at < seconds * 1000
+
+
+def get_reactions(message: discord.Message):
+    """Maps a message's reactions by their reaction_role emoji_id"""
+
+    reactions = {}
+    for reaction in message.reactions:
+        if reaction.custom_emoji:
+            reactions[str(reaction.emoji.id)] = reaction
+        else:
+            reactions[reaction.emoji] = reaction
+
+    return reactions
+
+
+emoji_re = re.compile(r"<a?:\w+:(\d+)>$")
+import_columns = ("channel_id", "message_id", "role_id", "reaction")
+
+
+def read_import(filename: str, data: bytes, max_size: int):
+    """Parses the rows of a reaction role export, or of a data dump"""
+
+    if filename.lower().endswith(".gz"):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = decompressor.decompress(data, max_size)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError("Incomplete or too large gzip file")
+        filename = filename[:-3]
+
+    text = data.decode("utf-8-sig")
+
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get("reaction_roles")
+        if not isinstance(rows, list):
+            raise ValueError("Expected a list of reaction roles")
+        return rows
+
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+class LimitReached(Exception):
+    pass
+
+
+ReactionRole = collections.namedtuple(
+    "ReactionRole",
+    "message_id channel_id guild_id role_id emoji_id",
+)
+
+
+class ReactionRoleIndex:
+    """Resident copy of the reaction_role table, keyed by message"""
+
+    def __init__(self):
+        self.messages = {}
+        self.guilds = collections.defaultdict(set)
+        self.channels = collections.Counter()
+        self.roles = collections.Counter()
+        self.loaded_guilds = set()
+
+    def is_loaded(self, guild_id: int):
+        return guild_id in self.loaded_guilds
+
+    def get_role_id(self, message_id: int, emoji_id: str):
+        try:
+            return self.messages[message_id][emoji_id].role_id
+        except KeyError:
+            return None
+
+    def count(self, guild_id: int):
+        return sum(
+            len(self.messages[message_id]) for message_id in self.guilds[guild_id]
+        )
+
+    def _unlink(self, reaction_role: ReactionRole):
+        for counter, key in (
+            (self.channels, reaction_role.channel_id),
+            (self.roles, reaction_role.role_id),
+        ):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+
+    def add(self, reaction_role: ReactionRole):
+        emojis = self.messages.setdefault(reaction_role.message_id, {})
+
+        previous = emojis.get(reaction_role.emoji_id)
+        if previous:
+            self._unlink(previous)
+
+        emojis[reaction_role.emoji_id] = reaction_role
+        self.guilds[reaction_role.guild_id].add(reaction_role.message_id)
+        self.channels[reaction_role.channel_id] += 1
+        self.roles[reaction_role.role_id] += 1
+
+    def remove(self, message_id: int, emoji_id: str):
+        emojis = self.messages.get(message_id)
+        if emojis is None:
+            return None
+
+        reaction_role = emojis.pop(emoji_id, None)
+        if reaction_role:
+            self._unlink(reaction_role)
+
+        if not emojis:
+            del self.messages[message_id]
+            if reaction_role:
+                self.guilds[reaction_role.guild_id].discard(message_id)
+
+        return reaction_role
+
+    def remove_rows(self, rows):
+        for row in rows:
+            self.remove(row["message_id"], row["emoji_id"])
+
+    def drop_guild(self, guild_id: int):
+        for message_id in self.guilds.pop(guild_id, ()):
+            for reaction_role in self.messages.pop(message_id, {}).values():
+                self._unlink(reaction_role)
+
+        self.loaded_guilds.discard(guild_id)
+
+    def load_guilds(self, guild_ids, rows):
+        for guild_id in guild_ids:
+            self.drop_guild(guild_id)
+
+        for row in rows:
+            self.add(ReactionRole(**row))
+
+        self.loaded_guilds.update(guild_ids)
+
+
 class Roles(cmd.Cog):
     """Automated actions on message reactions"""
 
+    coalesce_delay = 1.5
+    check_concurrency = 5
+    list_page_size = 5
+    recent_message_age = 300
+    filter_page_size = 5000
+    catch_up_interval = 1.0
+    catch_up_concurrency = 4
+    catch_up_slice = 1000
+    sync_prompt_interval = 5.0
+    reaction_role_limit = 250
+    import_max_size = 1024 * 1024
+    import_max_errors = 10
+
     def __init__(self, bot):
         super().__init__(bot)
 
-        self.recent_message_cache = cachetools.TTLCache(maxsize=float("inf"), ttl=300)
-        self.cache = cachetools.TTLCache(maxsize=float("inf"), ttl=900)
+        self.index = ReactionRoleIndex()
+        self.member_roles = cachetools.TTLCache(maxsize=65536, ttl=60)
+        self.scheduler = scheduler.RoleScheduler(
+            bot, self.apply_roles, delay=self.coalesce_delay
+        )
+        self.scheduler.start()
+        self.pending_deletes = {
+            "message_id": set(),
+            "channel_id": set(),
+            "role_id": set(),
+        }
+        self.flush_deletes.start()
+        self.filter = None
+        self.filter_pending = None
+        self.guild_loads = {}
+        self.catch_up_queue = asyncio.Queue()
+        self.catch_up_guilds = set()
+        self.catch_up_tasks = [
+            self.loop.create_task(self.catch_up())
+            for _ in range(self.catch_up_concurrency)
+        ]
+
+        if bot.is_ready():
+            self.loop.create_task(self.build_filter())
+            for shard_id in bot.shards:
+                self.loop.create_task(self.on_shard_ready(shard_id))
+
+    def cog_unload(self):
+        self.scheduler.stop()
+        self.flush_deletes.stop()
+        for task in self.catch_up_tasks:
+            task.cancel()
+
+    async def build_filter(self):
+        self.filter_pending = pending = set()
+
+        try:
+            count = await self.queries.fetchval("reaction_role.count_messages")
+            new_filter = bloom.BloomFilter(capacity=max(count * 2, 1024))
+
+            # Paged so filling the filter never holds the loop for long
+            after = 0
+            while True:
+                rows = await self.queries.fetch(
+                    "reaction_role.message_ids", after, self.filter_page_size
+                )
+                for row in rows:
+                    new_filter.add(row["message_id"])
+
+                if len(rows) < self.filter_page_size:
+                    break
+
+                after = rows[-1]["message_id"]
+                await asyncio.sleep(0)
+
+            for message_id in pending:
+                new_filter.add(message_id)
+
+            self.filter = new_filter
+        finally:
+            self.filter_pending = None
+
+    def add_to_filter(self, message_id: int):
+        if self.filter_pending is not None:
+            self.filter_pending.add(message_id)
+
+        if self.filter is None:
+            return
+
+        self.filter.add(message_id)
+        if len(self.filter) > self.filter.capacity and self.filter_pending is None:
+            self.loop.create_task(self.build_filter())
+
+    async def load_guilds(self, guild_ids):
+        rows = await self.queries.fetch(
+            "reaction_role.list_for_guilds",
+            guild_ids,
+        )
+
+        self.index.load_guilds(guild_ids, rows)
+
+    async def get_role_id(self, guild_id: int, message_id: int, emoji_id: str):
+        if self.index.is_loaded(guild_id):
+            return self.index.get_role_id(message_id, emoji_id)
+
+        return await self.queries.fetchval(
+            "reaction_role.get_role_id",
+            message_id,
+            emoji_id,
+        )
+
+    async def get_count(self, guild_id: int):
+        if self.index.is_loaded(guild_id):
+            return self.index.count(guild_id)
+
+        return await self.queries.fetchval(
+            "reaction_role.count",
+            guild_id,
+        )
+
+    async def publish_changes(self, guild_ids):
+        for guild_id in set(guild_ids):
+            await self.bot.invalidator.publish("reaction_role", guild_id)
+
+    @commands.Cog.listener()
+    async def on_cache_invalidate(self, kind: str, key: int):
+        if kind == "all":
+            await self.build_filter()
+            await self.load_guilds(list(self.index.loaded_guilds))
+            return
+
+        if kind != "reaction_role":
+            return
+
+        rows = await self.queries.fetch("reaction_role.list_for_guilds", [key])
+
+        for row in rows:
+            if self.filter is None or row["message_id"] not in self.filter:
+                self.add_to_filter(row["message_id"])
+
+        if self.index.is_loaded(key):
+            self.index.load_guilds([key], rows)
+
+    @commands.Cog.listener()
+    async def on_connect(self):
+        if self.filter is None and self.filter_pending is None:
+            await self.build_filter()
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        guild_ids = [
+            guild.id for guild in self.bot.guilds if guild.shard_id == shard_id
+        ]
+
+        await self.load_guilds(guild_ids)
+
+        for guild_id in guild_ids:
+            self.queue_catch_up(guild_id)
+
+    def queue_catch_up(self, guild_id: int):
+        if guild_id not in self.catch_up_guilds:
+            self.catch_up_guilds.add(guild_id)
+            self.catch_up_queue.put_nowait(guild_id)
+
+    async def catch_up(self):
+        """Gives roles for reactions that were added while events were missed
+
+        A few guilds are caught up at once, one message at a time. A guild
+        that still has work after `catch_up_slice` users goes to the back of
+        the queue, so large reactions don't hold up other guilds. Reactions
+        whose count is unchanged since the last catch-up are skipped, and the
+        user cursor is saved once a page of users has had its roles applied
+        so an interrupted catch-up resumes there. Roles can't be removed here,
+        finding members that removed their reaction would need the member
+        list.
+        """
+
+        while True:
+            guild_id = await self.catch_up_queue.get()
+
+            # Guilds stay in catch_up_guilds while running so only one task
+            # works on a guild at a time
+            unfinished = False
+            try:
+                unfinished = await self.catch_up_guild(guild_id)
+            except Exception:
+                await self.bot.on_error("reaction_role_catch_up", guild_id)
+
+            self.catch_up_guilds.discard(guild_id)
+            if unfinished:
+                self.queue_catch_up(guild_id)
+
+    async def catch_up_guild(self, guild_id: int):
+        """Catches up a guild, returns whether it stopped before finishing"""
+
+        guild = self.bot.get_guild(guild_id)
+        if guild is None or not guild.me.guild_permissions.manage_roles:
+            return False
+
+        remaining = self.catch_up_slice
+
+        rows = await self.queries.fetch("reaction_role.list_catch_up", guild_id)
+
+        for (channel_id, message_id), reaction_roles in itertools.groupby(
+            rows, key=lambda row: (row["channel_id"], row["message_id"])
+        ):
+            channel = guild.get_channel(channel_id)
+            if (
+                not channel
+                or not channel.permissions_for(guild.me).read_message_history
+            ):
+                continue
+
+            try:
+                message = await channel.fetch_message(message_id)
+            except discord.HTTPException:
+                continue
+
+            reactions = get_reactions(message)
+            for reaction_role in reaction_roles:
+                reaction = reactions.get(reaction_role["emoji_id"])
+                count = reaction.count if reaction else 0
+                after = reaction_role["catch_up_after"]
+
+                if after is None and count == reaction_role["reaction_count"]:
+                    continue
+
+                if reaction:
+                    remaining -= await self.give_reaction_roles(
+                        reaction,
+                        guild_id,
+                        reaction_role["role_id"],
+                        after=after,
+                        limit=remaining,
+                        on_page=functools.partial(
+                            self.save_catch_up_cursor,
+                            message_id,
+                            reaction_role["emoji_id"],
+                        ),
+                    )
+                    if remaining <= 0:
+                        return True
+
+                await self.queries.execute(
+                    "reaction_role.finish_catch_up",
+                    reaction_role["message_id"],
+                    reaction_role["emoji_id"],
+                    count,
+                )
+
+            await asyncio.sleep(self.catch_up_interval)
+
+        return False
+
+    async def save_catch_up_cursor(
+        self, message_id: int, emoji_id: str, user_id: int, seen: int
+    ):
+        await self.queries.execute(
+            "reaction_role.set_catch_up_after",
+            message_id,
+            emoji_id,
+            user_id,
+        )
+
+    async def give_reaction_roles(
+        self,
+        reaction: discord.Reaction,
+        guild_id: int,
+        role_id: int,
+        *,
+        after: int = None,
+        limit: int = None,
+        on_page=None,
+    ):
+        """Gives the role to every user of a reaction and returns the user count
+
+        Every page of 100 users is submitted at once and left to the
+        scheduler's coalescing and rate limiting, the next page is only
+        fetched once it has been applied. `on_page` is called after every
+        applied page. With `limit`, this stops at the first page boundary past
+        that many users.
+        """
+
+        users = reaction.users(after=discord.Object(after) if after else None)
+
+        submitted = []
+        seen = 0
+        async for user in users:
+            if user.id != self.bot.user.id:
+                submitted.append(
+                    self.scheduler.submit(guild_id, user.id, role_id, True)
+                )
+
+            seen += 1
+            if seen % 100 == 0:
+                await asyncio.gather(*submitted)
+                submitted.clear()
+
+                if on_page:
+                    await on_page(user.id, seen)
+
+                if limit is not None and seen >= limit:
+                    break
+
+        await asyncio.gather(*submitted)
+        return seen
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        await self.load_guilds([guild.id])
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.index.drop_guild(guild.id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, event: discord.RawReactionActionEvent):
@@ -197,6 +647,81 @@ class Roles(cmd.Cog):
 
         return role
 
+    def validate_import(self, guild: discord.Guild, rows):
+        reaction_roles = {}
+        errors = []
+
+        for number, row in enumerate(rows, start=1):
+            try:
+                channel_id = int(row["channel_id"])
+                message_id = int(row["message_id"])
+                role_id = int(row["role_id"])
+                reaction = str(row["reaction"]).strip()
+            except (KeyError, TypeError, ValueError):
+                errors.append(
+                    f"Row {number}: expected {', '.join(import_columns)} columns."
+                )
+                continue
+
+            role = guild.get_role(role_id)
+
+            if not isinstance(guild.get_channel(channel_id), discord.TextChannel):
+                errors.append(f"Row {number}: no text channel with ID {channel_id}.")
+            elif not role:
+                errors.append(f"Row {number}: no role with ID {role_id}.")
+            elif role.managed:
+                errors.append(f"Row {number}: {role.mention} is managed.")
+            elif role == guild.default_role:
+                errors.append(f"Row {number}: @everyone cannot be used.")
+            elif not reaction:
+                errors.append(f"Row {number}: no reaction given.")
+            else:
+                match = emoji_re.match(reaction)
+                emoji_id = match.group(1) if match else reaction
+
+                if (message_id, emoji_id) in reaction_roles:
+                    errors.append(f"Row {number}: duplicate of an earlier row.")
+                else:
+                    reaction_roles[message_id, emoji_id] = (
+                        channel_id,
+                        role_id,
+                        reaction,
+                    )
+
+        return reaction_roles, errors
+
+    async def verify_import_messages(self, guild: discord.Guild, reaction_roles):
+        """Checks that every imported message exists in the given channel"""
+
+        semaphore = asyncio.Semaphore(self.check_concurrency)
+
+        async def check_message(channel_id, message_id):
+            # The channel can be deleted after validate_import saw it
+            channel = guild.get_channel(channel_id)
+            if not channel:
+                return f"No channel with ID {channel_id}."
+
+            if not channel.permissions_for(guild.me).read_message_history:
+                return f"Can't read messages in {channel.mention}."
+
+            async with semaphore:
+                try:
+                    await channel.fetch_message(message_id)
+                except discord.NotFound:
+                    return f"No message with ID {message_id} in {channel.mention}."
+                except discord.HTTPException:
+                    return f"Can't read messages in {channel.mention}."
+
+        messages = sorted(
+            {
+                (channel_id, message_id)
+                for (message_id, _), (channel_id, *_) in reaction_roles.items()
+            }
+        )
+        results = await asyncio.gather(*(check_message(*key) for key in messages))
+
+        return [error for error in results if error is not None]
+
     @commands.group(invoke_without_command=True, aliases=["rr"])
     @commands.cooldown(4, 4, commands.BucketType.member)
     @commands.has_guild_permissions(manage_roles=True)
@@ -207,41 +732,57 @@ class Roles(cmd.Cog):
     @reactionrole.command(name="list")
     @commands.cooldown(4, 4, commands.BucketType.member)
     @commands.has_guild_permissions(manage_roles=True)
-    async def reactionrole_list(self, ctx: cmd.Context):
-        """Lists all messages with reaction roles enabled"""
+    async def reactionrole_list(
+        self,
+        ctx: cmd.Context,
+        *,
+        target: Union[discord.TextChannel, discord.Role] = None,
+    ):
+        """Lists messages with reaction roles, optionally for a channel or role"""
+
+        channel_filter = target.id if isinstance(target, discord.TextChannel) else None
+        role_filter = target.id if isinstance(target, discord.Role) else None
+
+        async def fetch(after):
+            rows = await self.queries.fetch(
+                "reaction_role.list_page",
+                ctx.guild.id,
+                after or 0,
+                channel_filter,
+                role_filter,
+                self.list_page_size,
+            )
+
+            fields = []
+            for (channel_id, message_id), roles in itertools.groupby(
+                rows, key=lambda rr: (rr["channel_id"], rr["message_id"])
+            ):
+                jump_url = (
+                    "https://discord.com/channels/"
+                    f"{ctx.guild.id}/{channel_id}/{message_id}"
+                )
+
+                fields.append(
+                    {
+                        "name": f"Message {message_id}",
+                        "value": f"In <#{channel_id}> ([go to message]({jump_url}))\n\n"
+                        + "\n".join(
+                            f"{role['reaction']} \N{RIGHTWARDS ARROW} <@&{role['role_id']}>"
+                            for role in roles
+                        ),
+                    }
+                )
+
+            if len(fields) < self.list_page_size:
+                return fields, None
+            return fields, rows[-1]["message_id"]
 
         embed = discord.Embed(title="Reaction roles")
         embed.set_footer(
             text="Page {current_page}/{total_pages}, "
             "showing message {first_field}..{last_field}/{total_fields}"
         )
-        paginator = menus.FieldPaginator(self.bot, base_embed=embed)
-
-        reaction_roles = itertools.groupby(
-            await self.db.fetch(
-                """
-                SELECT channel_id, message_id, role_id, reaction FROM reaction_role
-                WHERE guild_id = $1
-                ORDER BY message_id
-                """,
-                ctx.guild.id,
-            ),
-            key=lambda rr: (rr["channel_id"], rr["message_id"]),
-        )
-
-        for (channel_id, message_id), roles in reaction_roles:
-            jump_url = (
-                f"https://discord.com/channels/{ctx.guild.id}/{channel_id}/{message_id}"
-            )
-
-            paginator.add_field(
-                name=f"Message {message_id}",
-                value=f"In <#{channel_id}> ([go to message]({jump_url}))\n\n"
-                + "\n".join(
-                    f"{role['reaction']} \N{RIGHTWARDS ARROW} <@&{role['role_id']}>"
-                    for role in roles
-                ),
-            )
+        paginator = menus.LazyFieldPaginator(self.bot, base_embed=embed, fetch=fetch)
 
         await paginator.send(ctx)
 
@@ -251,14 +792,8 @@ class Roles(cmd.Cog):
     async def reactionrole_new(self, ctx: cmd.Context):
         """Creates a new reaction role"""
 
-        count = await self.db.fetchval(
-            """
-            SELECT COUNT(*) FROM reaction_role
-            WHERE guild_id = $1
-            """,
-            ctx.guild.id,
-        )
-        if count >= 250:
+        count = await self.get_count(ctx.guild.id)
+        if count >= self.reaction_role_limit:
             await ctx.prompt(
                 embed=discord.Embed(
                     title="Limit reached",
@@ -277,14 +812,7 @@ class Roles(cmd.Cog):
             target_message, emoji = await self.prompt_message_emoji(ctx)
             emoji_id = str(emoji.id or emoji.name)
 
-            role_id = await self.db.fetchval(
-                """
-                SELECT role_id FROM reaction_role
-                WHERE message_id = $1 AND emoji_id = $2
-                """,
-                target_message.id,
-                emoji_id,
-            )
+            role_id = await self.get_role_id(ctx.guild.id, target_message.id, emoji_id)
             if role_id:
                 role = ctx.guild.get_role(role_id)
                 if role:
@@ -298,14 +826,13 @@ class Roles(cmd.Cog):
                     )
                     return
 
-                await self.db.execute(
-                    """
-                    DELETE FROM reaction_role
-                    WHERE message_id = $1 AND emoji_id = $2
-                    """,
+                await self.queries.execute(
+                    "reaction_role.delete",
                     target_message.id,
                     emoji_id,
                 )
+                self.index.remove(target_message.id, emoji_id)
+                await self.publish_changes([ctx.guild.id])
 
             role = await self.prompt_role(ctx)
         except asyncio.TimeoutError:
@@ -358,11 +885,9 @@ class Roles(cmd.Cog):
                 pass
             return
 
-        await self.db.execute(
-            """
-            INSERT INTO reaction_role (message_id, channel_id, guild_id, role_id, reaction, emoji_id)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            """,
+        await self.queries.execute("guild_config.create", ctx.guild.id)
+        await self.queries.execute(
+            "reaction_role.create",
             target_message.id,
             target_message.channel.id,
             ctx.guild.id,
@@ -371,8 +896,17 @@ class Roles(cmd.Cog):
             emoji_id,
         )
 
-        self.cache.pop((target_message.id, emoji_id), None)
-        self.recent_message_cache.pop(target_message.id, None)
+        self.index.add(
+            ReactionRole(
+                message_id=target_message.id,
+                channel_id=target_message.channel.id,
+                guild_id=ctx.guild.id,
+                role_id=role.id,
+                emoji_id=emoji_id,
+            )
+        )
+        self.add_to_filter(target_message.id)
+        await self.publish_changes([ctx.guild.id])
 
         await ctx.prompt(
             embed=discord.Embed(
@@ -425,16 +959,14 @@ class Roles(cmd.Cog):
             pass
 
         emoji_id = str(event.emoji.id or event.emoji.name)
-        role_id = await self.db.fetchval(
-            """
-            DELETE FROM reaction_role
-            WHERE message_id = $1 AND emoji_id = $2
-            RETURNING role_id
-            """,
+        role_id = await self.queries.fetchval(
+            "reaction_role.delete",
             target_message.id,
             emoji_id,
         )
-        self.cache.pop((target_message.id, emoji_id), None)
+        self.index.remove(target_message.id, emoji_id)
+        if role_id:
+            await self.publish_changes([ctx.guild.id])
 
         if not role_id:
             await ctx.prompt(
@@ -468,14 +1000,12 @@ class Roles(cmd.Cog):
     async def reactionrole_clear_all(self, ctx: cmd.Context):
         """Clears all reaction roles in this server"""
 
-        reaction_roles = await self.db.fetch(
-            """
-            DELETE FROM reaction_role
-            WHERE guild_id = $1
-            RETURNING message_id
-            """,
-            ctx.guild.id,
+        reaction_roles = await self.queries.fetch(
+            "reaction_role.delete_by_guild_id",
+            [ctx.guild.id],
         )
+        self.index.remove_rows(reaction_roles)
+        await self.publish_changes(row["guild_id"] for row in reaction_roles)
 
         if len(reaction_roles) <= 0:
             await ctx.prompt(
@@ -504,14 +1034,12 @@ class Roles(cmd.Cog):
     ):
         """Clears reaction roles for a given message"""
 
-        reaction_roles = await self.db.fetch(
-            """
-            DELETE FROM reaction_role
-            WHERE message_id = $1
-            RETURNING true
-            """,
-            message.id if isinstance(message, discord.Message) else message,
+        reaction_roles = await self.queries.fetch(
+            "reaction_role.delete_by_message_id",
+            [message.id if isinstance(message, discord.Message) else message],
         )
+        self.index.remove_rows(reaction_roles)
+        await self.publish_changes(row["guild_id"] for row in reaction_roles)
 
         if len(reaction_roles) <= 0:
             await ctx.prompt(
@@ -536,14 +1064,12 @@ class Roles(cmd.Cog):
     async def reactionrole_clear_role(self, ctx: cmd.Context, *, role: discord.Role):
         """Clears reaction roles for a given role"""
 
-        reaction_roles = await self.db.fetch(
-            """
-            DELETE FROM reaction_role
-            WHERE role_id = $1
-            RETURNING message_id
-            """,
-            role.id if isinstance(role, discord.Role) else role,
+        reaction_roles = await self.queries.fetch(
+            "reaction_role.delete_by_role_id",
+            [role.id if isinstance(role, discord.Role) else role],
         )
+        self.index.remove_rows(reaction_roles)
+        await self.publish_changes(row["guild_id"] for row in reaction_roles)
 
         if len(reaction_roles) <= 0:
             await ctx.prompt(
@@ -564,6 +1090,241 @@ class Roles(cmd.Cog):
             )
         )
 
+    @reactionrole.command(name="export")
+    @commands.cooldown(3, 30, commands.BucketType.member)
+    @commands.has_guild_permissions(manage_roles=True)
+    async def reactionrole_export(self, ctx: cmd.Context):
+        """Exports the server's reaction roles as a CSV file"""
+
+        reaction_roles = await self.queries.fetch(
+            "reaction_role.list_for_guild",
+            ctx.guild.id,
+        )
+
+        if len(reaction_roles) <= 0:
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Couldn't export reaction roles",
+                    description="No reaction roles were configured for this server.",
+                )
+            )
+            return
+
+        fp = io.StringIO()
+        writer = csv.writer(fp)
+        writer.writerow(import_columns)
+        writer.writerows(
+            [row[column] for column in import_columns] for row in reaction_roles
+        )
+        fp.seek(0)
+
+        await ctx.prompt(
+            embed=discord.Embed(
+                title="Exported reaction roles",
+                description=f"Exported {len(reaction_roles)} reaction roles. Use"
+                f" {get_command_signature(ctx, self.reactionrole_import)} with"
+                " this file attached to import them again.",
+            ),
+            files=[discord.File(fp, filename=f"reaction-roles-{ctx.guild.id}.csv")],
+        )
+
+    @reactionrole.command(name="import")
+    @commands.cooldown(3, 30, commands.BucketType.member)
+    @commands.max_concurrency(1, commands.BucketType.guild)
+    @commands.has_guild_permissions(manage_roles=True)
+    async def reactionrole_import(self, ctx: cmd.Context):
+        """Creates reaction roles from an attached CSV or JSON file"""
+
+        if not ctx.message.attachments:
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Couldn't import reaction roles",
+                    description="Attach a CSV file with"
+                    f" {', '.join(import_columns)} columns, like the one made by"
+                    f" {get_command_signature(ctx, self.reactionrole_export)},"
+                    " or a complete data dump.",
+                )
+            )
+            return
+
+        attachment = ctx.message.attachments[0]
+
+        try:
+            if attachment.size > self.import_max_size:
+                raise ValueError("File too large")
+
+            rows = read_import(
+                attachment.filename,
+                await attachment.read(),
+                self.import_max_size,
+            )
+        except (ValueError, csv.Error, zlib.error):
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Couldn't import reaction roles",
+                    description="The attached file could not be read.",
+                )
+            )
+            return
+
+        reaction_roles, errors = self.validate_import(ctx.guild, rows)
+        if not errors:
+            errors = await self.verify_import_messages(ctx.guild, reaction_roles)
+
+        if errors or not reaction_roles:
+            description = "\n".join(errors[: self.import_max_errors])
+            if len(errors) > self.import_max_errors:
+                description += f"\n...and {len(errors) - self.import_max_errors} more."
+
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Couldn't import reaction roles",
+                    description=description or "The attached file has no rows.",
+                )
+            )
+            return
+
+        message_ids, emoji_ids = map(list, zip(*reaction_roles.keys()))
+        channel_ids, role_ids, reactions = map(list, zip(*reaction_roles.values()))
+
+        # Rows for the same message and emoji are replaced, the limit is
+        # checked by the insert itself and raising rolls back the replacing
+        try:
+            async with self.db.acquire() as conn, conn.transaction():
+                await self.queries.execute(
+                    "guild_config.create", ctx.guild.id, conn=conn
+                )
+                replaced = await self.queries.fetch(
+                    "reaction_role.delete_many_for_guild",
+                    ctx.guild.id,
+                    message_ids,
+                    emoji_ids,
+                    conn=conn,
+                )
+                result = await self.queries.fetchrow(
+                    "reaction_role.create_many",
+                    ctx.guild.id,
+                    message_ids,
+                    channel_ids,
+                    role_ids,
+                    reactions,
+                    emoji_ids,
+                    self.reaction_role_limit,
+                    conn=conn,
+                )
+                if not result["allowed"]:
+                    raise LimitReached()
+        except LimitReached:
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Limit reached",
+                    description="Importing these reaction roles would exceed the"
+                    f" maximum of {self.reaction_role_limit} reaction roles in"
+                    " this server. Please clean up any reaction roles that you"
+                    " no longer need.",
+                )
+            )
+            return
+
+        if self.index.is_loaded(ctx.guild.id):
+            await self.load_guilds([ctx.guild.id])
+        for message_id in set(message_ids):
+            self.add_to_filter(message_id)
+        await self.publish_changes([ctx.guild.id])
+
+        created = result["created"]
+        skipped = len(reaction_roles) - len(created)
+
+        await ctx.prompt(
+            embed=discord.Embed(
+                title="Imported reaction roles",
+                description=f"Successfully imported {len(created)} reaction roles"
+                f", replacing {len(replaced)} existing ones."
+                + (f" Skipped {skipped} that already existed." if skipped else "")
+                + f"\nUse {get_command_signature(ctx, self.reactionrole_sync)}"
+                " to give roles to members that already reacted, and"
+                f" {get_command_signature(ctx, self.reactionrole_check)}"
+                " to make sure reaction roles will function correctly.",
+            )
+        )
+
+    @reactionrole.command(name="sync")
+    @commands.cooldown(3, 30, commands.BucketType.member)
+    @commands.max_concurrency(1, commands.BucketType.guild)
+    @commands.has_guild_permissions(manage_roles=True)
+    @commands.bot_has_guild_permissions(manage_roles=True)
+    async def reactionrole_sync(
+        self, ctx: cmd.Context, *, message: converter.MessageConverter
+    ):
+        """Gives reaction roles to members that reacted before they were set up"""
+
+        reaction_roles = await self.queries.fetch(
+            "reaction_role.list_for_message",
+            message.id,
+        )
+
+        if len(reaction_roles) <= 0:
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Couldn't sync reaction roles",
+                    description="No reaction roles were configured for this message.",
+                )
+            )
+            return
+
+        reactions = get_reactions(message)
+        total = sum(
+            reactions[reaction_role["emoji_id"]].count
+            for reaction_role in reaction_roles
+            if reaction_role["emoji_id"] in reactions
+        )
+
+        checked = 0
+        prompted_at = time.monotonic()
+
+        async def update_progress(user_id, seen):
+            nonlocal prompted_at
+
+            if time.monotonic() - prompted_at < self.sync_prompt_interval:
+                return
+
+            prompted_at = time.monotonic()
+            await ctx.prompt(
+                embed=discord.Embed(
+                    title="Syncing reaction roles",
+                    description=f"Checked {checked + seen}/{total} reactions on"
+                    f" [this message]({message.jump_url}).",
+                )
+            )
+
+        for reaction_role in reaction_roles:
+            reaction = reactions.get(reaction_role["emoji_id"])
+            if not reaction:
+                continue
+
+            checked += await self.give_reaction_roles(
+                reaction,
+                ctx.guild.id,
+                reaction_role["role_id"],
+                on_page=update_progress,
+            )
+
+            await self.queries.execute(
+                "reaction_role.finish_catch_up",
+                message.id,
+                reaction_role["emoji_id"],
+                reaction.count,
+            )
+
+        await ctx.prompt(
+            embed=discord.Embed(
+                title="Reaction roles synced",
+                description="Members that reacted on [this message]"
+                f"({message.jump_url}) have been given their roles,"
+                f" {checked} reactions were checked.",
+            )
+        )
+
     @reactionrole.command(name="check")
     @commands.cooldown(3, 30, commands.BucketType.member)
     @commands.max_concurrency(1, commands.BucketType.guild)
@@ -572,53 +1333,68 @@ class Roles(cmd.Cog):
         """Checks if reaction roles are set up correctly"""
 
         async with ctx.typing():
-            reaction_roles = await self.db.fetch(
-                """
-                SELECT channel_id, message_id, role_id, emoji_id FROM reaction_role
-                WHERE guild_id = $1
-                ORDER BY message_id
-                """,
+            reaction_roles = await self.queries.fetch(
+                "reaction_role.list_for_guild",
                 ctx.guild.id,
             )
 
+            messages = {}
+            for reaction_role in reaction_roles:
+                key = (reaction_role["channel_id"], reaction_role["message_id"])
+                messages.setdefault(key, []).append(reaction_role)
+
+            semaphore = asyncio.Semaphore(self.check_concurrency)
+
+            async def check_message(channel_id, message_id):
+                channel = ctx.guild.get_channel(channel_id)
+                if not channel:
+                    return "deleted"
+
+                if not channel.permissions_for(ctx.me).read_message_history:
+                    return "cannot_read"
+
+                async with semaphore:
+                    try:
+                        await channel.fetch_message(message_id)
+                    except discord.NotFound:
+                        return "deleted"
+                    except discord.HTTPException:
+                        return "cannot_read"
+
+                return "ok"
+
+            results = await asyncio.gather(
+                *(check_message(*key) for key in messages.keys())
+            )
+
             deleted_messages = []
             cannot_read = []
             role_hierachy = []
 
-            for reaction_role in reaction_roles:
-                channel = ctx.guild.get_channel(reaction_role["channel_id"])
-                if not channel:
-                    deleted_messages.append(reaction_role)
+            for rows, result in zip(messages.values(), results):
+                if result == "deleted":
+                    deleted_messages.extend(rows)
                     continue
 
-                message = None
-                try:
-                    message = await channel.fetch_message(reaction_role["message_id"])
-                except discord.NotFound:
-                    deleted_messages.append(reaction_role)
-                    continue
-                except discord.HTTPException:
-                    cannot_read.append(reaction_role)
-                    continue
-
-                role = ctx.guild.get_role(reaction_role["role_id"])
-                if not role:
-                    deleted_messages.append(reaction_role)
+                if result == "cannot_read":
+                    cannot_read.extend(rows)
                     continue
 
-                if role >= ctx.me.top_role:
-                    role_hierachy.append(reaction_role)
-
-            await self.db.executemany(
-                """
-                DELETE FROM reaction_role
-                WHERE message_id = $1 AND emoji_id = $2
-                """,
-                [
-                    (reaction_role["message_id"], reaction_role["emoji_id"])
-                    for role in deleted_messages
-                ],
-            )
+                for reaction_role in rows:
+                    role = ctx.guild.get_role(reaction_role["role_id"])
+                    if not role:
+                        deleted_messages.append(reaction_role)
+                    elif role >= ctx.me.top_role:
+                        role_hierachy.append(reaction_role)
+
+            if deleted_messages:
+                rows = await self.queries.fetch(
+                    "reaction_role.delete_many",
+                    [reaction_role["message_id"] for reaction_role in deleted_messages],
+                    [reaction_role["emoji_id"] for reaction_role in deleted_messages],
+                )
+                self.index.remove_rows(rows)
+                await self.publish_changes(row["guild_id"] for row in rows)
 
             embed = discord.Embed(
                 title="Reaction role automated checkup",
@@ -666,90 +1442,202 @@ class Roles(cmd.Cog):
 
             await ctx.prompt(embed=embed)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        self.recent_message_cache[message.id] = True
+    async def ensure_guild(self, guild_id: int):
+        """Loads a guild's reaction roles on first use in worker processes"""
+
+        if self.bot.worker_id is None or self.index.is_loaded(guild_id):
+            return
+
+        task = self.guild_loads.get(guild_id)
+        if task is None:
+            task = self.guild_loads[guild_id] = self.loop.create_task(
+                self.load_guilds([guild_id])
+            )
+            task.add_done_callback(lambda _: self.guild_loads.pop(guild_id, None))
+
+        await asyncio.shield(task)
 
     @commands.Cog.listener()
     async def on_raw_reaction_toggle(self, event: discord.RawReactionActionEvent):
-        if event.message_id in self.recent_message_cache:
+        if not event.guild_id or self.bot.forwarder:
             return
 
-        emoji_id = str(event.emoji.id or event.emoji.name)
+        roles = None
+        if event.member is not None and event.member.guild is not None:
+            roles = {
+                role.id for role in event.member.roles if role.id != event.guild_id
+            }
+
+        self.bot.dispatch(
+            "reaction_toggle",
+            event.guild_id,
+            event.message_id,
+            event.user_id,
+            str(event.emoji.id or event.emoji.name),
+            event.event_type == "REACTION_ADD",
+            roles,
+        )
+
+    @commands.Cog.listener()
+    async def on_reaction_toggle(
+        self,
+        guild_id: int,
+        message_id: int,
+        user_id: int,
+        emoji_id: str,
+        add: bool,
+        roles: set = None,
+    ):
+        await self.ensure_guild(guild_id)
 
         role_id = None
-        try:
-            role_id = self.cache[(event.message_id, emoji_id)]
-        except KeyError:
-            role_id = await self.db.fetchval(
-                """
-                SELECT role_id FROM reaction_role
-                WHERE message_id = $1 AND emoji_id = $2
-                """,
-                event.message_id,
-                emoji_id,
-            )
-            self.cache[(event.message_id, emoji_id)] = role_id
+        if self.index.is_loaded(guild_id):
+            role_id = self.index.get_role_id(message_id, emoji_id)
+        elif (
+            is_recent(message_id, self.recent_message_age)
+            and message_id not in self.index.messages
+        ):
+            return
+        elif self.filter is not None and message_id not in self.filter:
+            return
+        else:
+            role_id = await self.get_role_id(guild_id, message_id, emoji_id)
 
         if not role_id:
             return
 
-        member = None
-        try:
-            guild = self.bot.get_guild(event.guild_id)
-            member = await guild.fetch_member(event.user_id)
-        except discord.NotFound:
-            return
+        self.scheduler.submit(guild_id, user_id, role_id, add, roles)
+
+    async def apply_roles(
+        self,
+        guild_id: int,
+        user_id: int,
+        changes: dict,
+        roles: set = None,
+    ):
+        key = (guild_id, user_id)
 
         try:
-            if event.event_type == "REACTION_ADD":
-                await member.add_roles(discord.Object(id=role_id))
-            elif event.event_type == "REACTION_REMOVE":
-                await member.remove_roles(discord.Object(id=role_id))
+            # A member edit replaces the whole role list, so it is only built
+            # from the member as fetched right now and only when it saves calls
+            if len(changes) > 2:
+                member = await self.bot.http.get_member(guild_id, user_id)
+                roles = {int(role_id) for role_id in member["roles"]}
+
+                added = {role_id for role_id, add in changes.items() if add}
+                new_roles = (roles - changes.keys()) | added
+                if new_roles != roles:
+                    await self.bot.http.edit_member(
+                        guild_id, user_id, roles=list(new_roles)
+                    )
+
+                self.member_roles[key] = new_roles
+                return
+
+            if roles is None:
+                roles = self.member_roles.get(key)
+
+            for role_id, add in changes.items():
+                if roles is not None and (role_id in roles) == add:
+                    continue
+
+                if add:
+                    await self.bot.http.add_role(guild_id, user_id, role_id)
+                else:
+                    await self.bot.http.remove_role(guild_id, user_id, role_id)
+
+                if roles is not None:
+                    roles = roles | {role_id} if add else roles - {role_id}
+                    self.member_roles[key] = roles
+        except discord.NotFound:
+            self.member_roles.pop(key, None)
         except discord.HTTPException:
             pass
 
+    def queue_delete(self, column: str, ids):
+        self.pending_deletes[column].update(ids)
+
+    @tasks.loop(seconds=5.0)
+    async def flush_deletes(self):
+        for column in self.pending_deletes.keys():
+            ids = self.pending_deletes[column]
+            if not ids:
+                continue
+
+            self.pending_deletes[column] = set()
+
+            try:
+                rows = await self.queries.fetch(
+                    f"reaction_role.delete_by_{column}",
+                    list(ids),
+                )
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError):
+                self.pending_deletes[column].update(ids)
+                await self.bot.on_error("flush_deletes", column)
+                continue
+
+            self.index.remove_rows(rows)
+
+            await self.publish_changes(row["guild_id"] for row in rows)
+
+    @flush_deletes.after_loop
+    async def after_flush_deletes(self):
+        # The loop is stopped on unload, flush what is still buffered. On
+        # shutdown Bot.close has flushed already, before closing the pool
+        await self.flush_deletes()
+
     @commands.Cog.listener()
     async def on_raw_message_delete(self, event: discord.RawMessageDeleteEvent):
-        await self.db.execute(
-            """
-            DELETE FROM reaction_role
-            WHERE message_id = $1
-            """,
-            event.message_id,
-        )
+        if self.bot.forwarder or event.guild_id is None:
+            return
+
+        await self.ensure_guild(event.guild_id)
+        if (
+            self.index.is_loaded(event.guild_id)
+            and event.message_id not in self.index.messages
+        ):
+            return
+
+        self.queue_delete("message_id", [event.message_id])
 
     @commands.Cog.listener()
     async def on_raw_bulk_message_delete(
         self, event: discord.RawBulkMessageDeleteEvent
     ):
-        await self.db.execute(
-            """
-            DELETE FROM reaction_role
-            WHERE message_id = any($1::bigint[])
-            """,
-            event.message_ids,
-        )
+        if self.bot.forwarder or event.guild_id is None:
+            return
+
+        await self.ensure_guild(event.guild_id)
+        message_ids = event.message_ids
+        if self.index.is_loaded(event.guild_id):
+            message_ids = message_ids & self.index.messages.keys()
+
+        self.queue_delete("message_id", message_ids)
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
-        await self.db.execute(
-            """
-            DELETE FROM reaction_role
-            WHERE channel_id = $1
-            """,
-            channel.id,
-        )
+        if (
+            self.index.is_loaded(channel.guild.id)
+            and channel.id not in self.index.channels
+        ):
+            return
+
+        self.queue_delete("channel_id", [channel.id])
 
     @commands.Cog.listener()
     async def on_guild_role_delete(self, role: discord.Role):
-        await self.db.execute(
-            """
-            DELETE FROM reaction_role
-            WHERE role_id = $1
-            """,
-            role.id,
-        )
+        if self.index.is_loaded(role.guild.id) and role.id not in self.index.roles:
+            return
+
+        self.queue_delete("role_id", [role.id])
+
+    @commands.Cog.listener()
+    async def on_raw_guild_channel_delete(self, guild_id: int, channel_id: int):
+        self.queue_delete("channel_id", [channel_id])
+
+    @commands.Cog.listener()
+    async def on_raw_guild_role_delete(self, guild_id: int, role_id: int):
+        self.queue_delete("role_id", [role_id])
 
 
 def setup(bot):
@@ -0,0 +1,37 @@
+import asyncio
+import collections
+import time
+
+
+class IdentifyBuckets:
+    """Paces identifies per `shard_id % max_concurrency` bucket.
+
+    Discord allows one identify per bucket every 5 seconds, so shards in
+    different buckets can identify at the same time.
+    """
+
+    interval = 5.0
+
+    def __init__(self, max_concurrency: int = 1):
+        self.max_concurrency = max_concurrency
+        self.next_identify = {}
+        self.locks = collections.defaultdict(asyncio.Lock)
+
+    def bucket(self, shard_id: int):
+        return shard_id % self.max_concurrency
+
+    def ready_in(self, bucket: int, now: float):
+        return self.next_identify.get(bucket, now) - now
+
+    def take(self, bucket: int, now: float):
+        self.next_identify[bucket] = now + self.interval
+
+    async def wait(self, shard_id: int):
+        bucket = self.bucket(shard_id)
+
+        async with self.locks[bucket]:
+            delay = self.ready_in(bucket, time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self.take(bucket, time.monotonic())
@@ -0,0 +1,74 @@
+import asyncio
+import secrets
+
+import asyncpg
+from discord.ext import commands
+
+from bot import queries
+
+channel = "cache_invalidation"
+
+queries.register(
+    "cache.notify",
+    f"""
+    SELECT pg_notify('{channel}', $1::text)
+    """,
+)
+
+
+class CacheInvalidator:
+    """Shares cache invalidations between bot processes.
+
+    Mutations publish a `<origin> <kind> <key>` notice with Postgres `NOTIFY`.
+    Every process holds one `LISTEN` connection and dispatches notices from
+    other processes as `cache_invalidate(kind, key)` events. When the listen
+    connection has to be re-established, notices may have been missed, so
+    `cache_invalidate("all", None)` is dispatched instead.
+    """
+
+    def __init__(self, bot: commands.Bot, dsn: str, *, check_interval: float = 30.0):
+        self.bot = bot
+        self.dsn = dsn
+        self.check_interval = check_interval
+
+        self.origin = secrets.token_hex(4)
+        self.connection = None
+        self.task = None
+
+    async def connect(self):
+        self.connection = await asyncpg.connect(dsn=self.dsn)
+        await self.connection.add_listener(channel, self.on_notification)
+
+    async def start(self):
+        await self.connect()
+        self.task = self.bot.loop.create_task(self.keep_alive())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.connection and not self.connection.is_closed():
+            await self.connection.close()
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+
+            if not self.connection.is_closed():
+                continue
+
+            try:
+                await self.connect()
+            except (asyncpg.PostgresError, OSError):
+                continue
+
+            self.bot.dispatch("cache_invalidate", "all", None)
+
+    def on_notification(self, connection, pid, channel, payload):
+        origin, kind, key = payload.split(" ", 2)
+        if origin == self.origin:
+            return
+
+        self.bot.dispatch("cache_invalidate", kind, int(key))
+
+    async def publish(self, kind: str, key: int):
+        await self.bot.queries.execute("cache.notify", f"{self.origin} {kind} {key}")
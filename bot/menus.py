@@ -1,4 +1,5 @@
 import asyncio
+import math
 import typing
 
 import discord
@@ -70,6 +71,15 @@ class FieldPaginator:
                 }
             )
 
+    def get_footer_values(self, index: int):
+        return {
+            "current_page": index + 1,
+            "total_pages": len(self.pages),
+            "first_field": sum(len(page) for page in self.pages[:index]) + 1,
+            "last_field": sum(len(page) for page in self.pages[: index + 1]),
+            "total_fields": sum(len(page) for page in self.pages),
+        }
+
     def get_embed_for_page(self, index: int):
         embed = self.base_embed.copy()
 
@@ -78,19 +88,17 @@ class FieldPaginator:
 
         if embed.footer.text != discord.Embed.Empty:
             embed.set_footer(
-                text=embed.footer.text.format(
-                    current_page=index + 1,
-                    total_pages=len(self.pages),
-                    first_field=sum(len(page) for page in self.pages[:index]) + 1,
-                    last_field=sum(len(page) for page in self.pages[: index + 1]),
-                    total_fields=sum(len(page) for page in self.pages),
-                ),
+                text=embed.footer.text.format(**self.get_footer_values(index)),
                 icon_url=embed.footer.icon_url,
             )
 
         return embed
 
+    async def load_page(self, index: int):
+        return max(0, min(len(self.pages) - 1, index))
+
     async def send(self, ctx: cmd.Context):
+        await self.load_page(0)
         message = await ctx.send(embed=self.get_embed_for_page(0))
 
         if len(self.pages) <= 1:
@@ -115,14 +123,15 @@ class FieldPaginator:
         page = 0
 
         async def set_page(index):
-            page = max(0, min(len(self.pages), index))
+            nonlocal page
+            page = await self.load_page(index)
             await message.edit(embed=self.get_embed_for_page(page))
 
         actions = {
             self.action_first: lambda: set_page(0),
             self.action_previous: lambda: set_page(page - 1),
             self.action_next: lambda: set_page(page + 1),
-            self.action_last: lambda: set_page(len(self.pages) - 1),
+            self.action_last: lambda: set_page(math.inf),
         }
 
         def check(event: discord.RawReactionActionEvent):
@@ -154,6 +163,49 @@ class FieldPaginator:
                     pass
 
 
+class LazyFieldPaginator(FieldPaginator):
+    """Field paginator that only requests fields as pages are viewed.
+
+    `fetch` is called with the cursor it returned last (`None` the first
+    time) and must return a list of fields, as passed to `add_field`, and the
+    cursor for the next call, or `None` once there are no more fields.
+    Fields that were loaded once are kept.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        *,
+        base_embed: discord.Embed = discord.Embed(),
+        fetch: typing.Callable[[typing.Any], typing.Awaitable[tuple]],
+    ):
+        super().__init__(bot, base_embed=base_embed)
+
+        self.fetch = fetch
+        self.cursor = None
+        self.exhausted = False
+
+    def get_footer_values(self, index: int):
+        values = super().get_footer_values(index)
+
+        if not self.exhausted:
+            values["total_pages"] = f"{values['total_pages']}+"
+            values["total_fields"] = f"{values['total_fields']}+"
+
+        return values
+
+    async def load_page(self, index: int):
+        # A page is only complete once the page after it has been started
+        while not self.exhausted and len(self.pages) <= index + 1:
+            fields, self.cursor = await self.fetch(self.cursor)
+            self.exhausted = self.cursor is None
+
+            for field in fields:
+                self.add_field(**field)
+
+        return await super().load_page(index)
+
+
 class ConfirmationPrompt:
     action_confirm = "\N{WHITE HEAVY CHECK MARK}"
     action_deny = "\N{NEGATIVE SQUARED CROSS MARK}"
@@ -12,3 +12,36 @@ def patch_fail_if_not_exists(cls):
 
 for cls in (discord.Message, discord.MessageReference):
     patch_fail_if_not_exists(cls)
+
+
+def patch_message_create_filter(cls):
+    orig = cls.parse_message_create
+
+    def parse_message_create(self, data):
+        check = getattr(self._get_client(), "should_parse_message", None)
+        if check is None or check(data):
+            orig(self, data)
+
+    cls.parse_message_create = parse_message_create
+
+
+patch_message_create_filter(discord.state.ConnectionState)
+
+
+def patch_session_resume(cls):
+    orig = cls.from_client.__func__
+
+    async def from_client(cls, client, *, shard_id=None, resume=False, **kwargs):
+        take = getattr(client, "take_resume_session", None)
+        if not resume and take is not None:
+            session = await take(shard_id)
+            if session is not None:
+                kwargs["session"], kwargs["sequence"] = session
+                resume = True
+
+        return await orig(cls, client, shard_id=shard_id, resume=resume, **kwargs)
+
+    cls.from_client = classmethod(from_client)
+
+
+patch_session_resume(discord.gateway.DiscordWebSocket)
@@ -0,0 +1,44 @@
+import re
+from typing import Optional
+
+
+class PrefixMatcher:
+    """Matches message content against the bot's prefixes in a single pass.
+
+    Each guild gets one compiled pattern that covers both mention prefixes and
+    its configured prefix, with or without a trailing space. Patterns are
+    compiled again when the prefix they were built for changes.
+    """
+
+    def __init__(self):
+        self.user_id = None
+        self.mentions = frozenset()
+        self.patterns = {}
+
+    def set_user(self, user_id: int):
+        if user_id == self.user_id:
+            return
+
+        self.user_id = user_id
+        self.mentions = frozenset((f"<@{user_id}>", f"<@!{user_id}>"))
+        self.patterns.clear()
+
+    def is_mention(self, content: str):
+        return content in self.mentions
+
+    def compile(self, prefix: str):
+        return re.compile(rf"<@!?{self.user_id}> |{re.escape(prefix)} ?")
+
+    def match(self, guild_id: Optional[int], prefix: str, content: str):
+        cached = self.patterns.get(guild_id)
+        if cached is None or cached[0] != prefix:
+            cached = self.patterns[guild_id] = (prefix, self.compile(prefix))
+
+        match = cached[1].match(content)
+        return match.group() if match else None
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        if guild_id is None:
+            self.patterns.clear()
+        else:
+            self.patterns.pop(guild_id, None)
@@ -0,0 +1,289 @@
+import collections
+import time
+
+import asyncpg
+
+statements = {}
+
+
+def register(name: str, sql: str):
+    """Registers a named statement, parameters should be cast to their types"""
+
+    if statements.get(name, sql) != sql:
+        raise RuntimeError(f"Statement {name!r} is already registered")
+
+    statements[name] = sql
+
+
+register(
+    "guild_config.get",
+    """
+    SELECT * FROM guild_config
+    WHERE guild_id = $1::bigint
+    """,
+)
+register(
+    "guild_config.list_for_guilds",
+    """
+    SELECT * FROM guild_config
+    WHERE guild_id = any($1::bigint[])
+    """,
+)
+register(
+    "guild_config.create",
+    """
+    INSERT INTO guild_config (guild_id)
+    VALUES ($1::bigint)
+    ON CONFLICT DO NOTHING
+    """,
+)
+register(
+    "guild_config.delete",
+    """
+    DELETE FROM guild_config
+    WHERE guild_id = $1::bigint
+    """,
+)
+
+register(
+    "reaction_role.count_messages",
+    """
+    SELECT COUNT(DISTINCT message_id) FROM reaction_role
+    """,
+)
+register(
+    "reaction_role.message_ids",
+    """
+    SELECT DISTINCT message_id FROM reaction_role
+    WHERE message_id > $1::bigint
+    ORDER BY message_id
+    LIMIT $2::int
+    """,
+)
+register(
+    "reaction_role.list_for_guilds",
+    """
+    SELECT message_id, channel_id, guild_id, role_id, emoji_id
+    FROM reaction_role
+    WHERE guild_id = any($1::bigint[])
+    """,
+)
+register(
+    "reaction_role.list_for_guild",
+    """
+    SELECT * FROM reaction_role
+    WHERE guild_id = $1::bigint
+    ORDER BY message_id
+    """,
+)
+register(
+    "reaction_role.list_page",
+    """
+    WITH reaction_roles AS (
+        SELECT channel_id, message_id, role_id, reaction FROM reaction_role
+        WHERE guild_id = $1::bigint AND message_id > $2::bigint
+        AND ($3::bigint IS NULL OR channel_id = $3::bigint)
+        AND ($4::bigint IS NULL OR role_id = $4::bigint)
+    )
+    SELECT * FROM reaction_roles
+    WHERE message_id IN (
+        SELECT DISTINCT message_id FROM reaction_roles
+        ORDER BY message_id
+        LIMIT $5::int
+    )
+    ORDER BY message_id
+    """,
+)
+register(
+    "reaction_role.list_for_message",
+    """
+    SELECT emoji_id, role_id FROM reaction_role
+    WHERE message_id = $1::bigint
+    """,
+)
+register(
+    "reaction_role.list_catch_up",
+    """
+    SELECT message_id, channel_id, guild_id, role_id, emoji_id,
+    reaction_count, catch_up_after
+    FROM reaction_role
+    WHERE guild_id = $1::bigint
+    ORDER BY message_id
+    """,
+)
+register(
+    "reaction_role.set_catch_up_after",
+    """
+    UPDATE reaction_role
+    SET catch_up_after = $3::bigint
+    WHERE message_id = $1::bigint AND emoji_id = $2::text
+    """,
+)
+register(
+    "reaction_role.finish_catch_up",
+    """
+    UPDATE reaction_role
+    SET reaction_count = $3::int, catch_up_after = NULL
+    WHERE message_id = $1::bigint AND emoji_id = $2::text
+    """,
+)
+register(
+    "reaction_role.get_role_id",
+    """
+    SELECT role_id FROM reaction_role
+    WHERE message_id = $1::bigint AND emoji_id = $2::text
+    """,
+)
+register(
+    "reaction_role.count",
+    """
+    SELECT COUNT(*) FROM reaction_role
+    WHERE guild_id = $1::bigint
+    """,
+)
+register(
+    "reaction_role.create",
+    """
+    INSERT INTO reaction_role (
+        message_id, channel_id, guild_id, role_id, reaction, emoji_id
+    )
+    VALUES ($1::bigint, $2::bigint, $3::bigint, $4::bigint, $5::text, $6::text)
+    """,
+)
+register(
+    "reaction_role.create_many",
+    """
+    WITH allowed AS (
+        SELECT COUNT(*) + cardinality($2::bigint[]) <= $7::bigint AS allowed
+        FROM reaction_role
+        WHERE guild_id = $1::bigint
+    ), created AS (
+        INSERT INTO reaction_role (
+            message_id, channel_id, guild_id, role_id, reaction, emoji_id
+        )
+        SELECT message_id, channel_id, $1::bigint, role_id, reaction, emoji_id
+        FROM unnest(
+            $2::bigint[], $3::bigint[], $4::bigint[], $5::text[], $6::text[]
+        ) AS imported (message_id, channel_id, role_id, reaction, emoji_id)
+        WHERE (SELECT allowed FROM allowed)
+        ON CONFLICT DO NOTHING
+        RETURNING message_id
+    )
+    SELECT
+        (SELECT allowed FROM allowed) AS allowed,
+        array(SELECT message_id FROM created) AS created
+    """,
+)
+register(
+    "reaction_role.delete",
+    """
+    DELETE FROM reaction_role
+    WHERE message_id = $1::bigint AND emoji_id = $2::text
+    RETURNING role_id
+    """,
+)
+register(
+    "reaction_role.delete_many",
+    """
+    DELETE FROM reaction_role
+    WHERE (message_id, emoji_id) IN (
+        SELECT * FROM unnest($1::bigint[], $2::text[])
+    )
+    RETURNING message_id, emoji_id, guild_id
+    """,
+)
+register(
+    "reaction_role.delete_many_for_guild",
+    """
+    DELETE FROM reaction_role
+    WHERE guild_id = $1::bigint AND (message_id, emoji_id) IN (
+        SELECT * FROM unnest($2::bigint[], $3::text[])
+    )
+    RETURNING message_id, emoji_id, guild_id
+    """,
+)
+for column in ("guild_id", "message_id", "channel_id", "role_id"):
+    register(
+        f"reaction_role.delete_by_{column}",
+        f"""
+        DELETE FROM reaction_role
+        WHERE {column} = any($1::bigint[])
+        RETURNING message_id, emoji_id, guild_id
+        """,
+    )
+
+
+class StatementStats:
+    __slots__ = ("calls", "errors", "total_time", "max_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_time": self.total_time,
+            "average_time": self.total_time / self.calls if self.calls else 0.0,
+            "max_time": self.max_time,
+        }
+
+
+class Queries:
+    """Runs registered statements by name and records their latency.
+
+    asyncpg prepares every statement once per connection and keeps it in the
+    connection's statement cache, keyed by its text. Going through the
+    registry keeps that text identical for every caller, so hot statements
+    are only parsed and planned once per pool connection.
+    """
+
+    def __init__(self, pool: asyncpg.pool.Pool):
+        self.pool = pool
+        self.stats = collections.defaultdict(StatementStats)
+
+    async def _run(self, method: str, name: str, args, conn):
+        stats = self.stats[name]
+        started_at = time.perf_counter()
+
+        try:
+            return await getattr(conn or self.pool, method)(statements[name], *args)
+        except asyncpg.PostgresError:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+
+    async def fetch(self, name: str, *args, conn: asyncpg.Connection = None):
+        return await self._run("fetch", name, args, conn)
+
+    async def fetchrow(self, name: str, *args, conn: asyncpg.Connection = None):
+        return await self._run("fetchrow", name, args, conn)
+
+    async def fetchval(self, name: str, *args, conn: asyncpg.Connection = None):
+        return await self._run("fetchval", name, args, conn)
+
+    async def execute(self, name: str, *args, conn: asyncpg.Connection = None):
+        return await self._run("execute", name, args, conn)
+
+    async def cursor(self, name: str, *args, conn: asyncpg.Connection):
+        """Opens a server-side cursor, `conn` must be inside a transaction"""
+
+        return await self._run("cursor", name, args, conn)
+
+    def get_stats(self):
+        return {
+            name: stats.as_dict()
+            for name, stats in sorted(
+                self.stats.items(),
+                key=lambda item: item[1].total_time,
+                reverse=True,
+            )
+        }
@@ -0,0 +1,217 @@
+import asyncio
+import collections
+import time
+
+import cachetools
+from discord.ext import commands
+
+
+class PendingChange:
+    __slots__ = ("submitted_at", "changes", "roles", "done")
+
+    def __init__(self, submitted_at: float, done: asyncio.Future):
+        self.submitted_at = submitted_at
+        self.changes = {}
+        self.roles = None
+        self.done = done
+
+    def finish(self):
+        if not self.done.done():
+            self.done.set_result(None)
+
+
+class RoleScheduler:
+    """Queue of role changes that is drained fairly across guilds.
+
+    Changes are buffered per member for `delay` seconds, during which further
+    changes for the same member are merged into the pending entry and an add
+    followed by a remove of the same role (or the other way around) cancels
+    out. `apply` is then called once per member with the guild ID, user ID,
+    a mapping of role ID to whether it should be added, and the most recent
+    set of the member's role IDs seen, if any. `submit` returns a future that
+    is done once the member's entry has been applied or dropped.
+
+    Every guild gets its own queue. Guilds are served round-robin, one member
+    per guild per pass, and each guild's member role route bucket is predicted
+    locally as a token bucket of `rate` requests per `per` seconds so a guild
+    that is out of tokens is skipped instead of blocking on discord.py's bucket
+    lock.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        apply,
+        *,
+        delay: float = 1.5,
+        rate: int = 10,
+        per: float = 10.0,
+        concurrency: int = 16,
+    ):
+        self.bot = bot
+        self.apply = apply
+        self.delay = delay
+        self.rate = rate
+        self.per = per
+
+        self.queues = collections.OrderedDict()
+        self.pending = {}
+        self.running = set()
+        self.buckets = cachetools.TTLCache(maxsize=float("inf"), ttl=per)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+        self.depth = 0
+        self.submitted = 0
+        self.processed = 0
+        self.wait_times = collections.deque(maxlen=1024)
+
+    def start(self):
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        for entry in self.pending.values():
+            entry.done.cancel()
+
+    def submit(
+        self,
+        guild_id: int,
+        user_id: int,
+        role_id: int,
+        add: bool,
+        roles: set = None,
+    ):
+        self.submitted += 1
+
+        key = (guild_id, user_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = PendingChange(
+                time.monotonic(), self.bot.loop.create_future()
+            )
+
+            queue = self.queues.get(guild_id)
+            if queue is None:
+                queue = self.queues[guild_id] = collections.deque()
+
+            queue.append(key)
+            self.depth += 1
+            self.wakeup.set()
+
+        if roles is not None:
+            entry.roles = roles
+
+        if entry.changes.get(role_id, add) != add:
+            del entry.changes[role_id]
+        else:
+            entry.changes[role_id] = add
+
+        return entry.done
+
+    def guild_depth(self, guild_id: int):
+        running = sum(1 for key in self.running if key[0] == guild_id)
+        return len(self.queues.get(guild_id, ())) + running
+
+    def _take_token(self, guild_id: int, now: float):
+        tokens, updated_at = self.buckets.get(guild_id, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - updated_at) * self.rate / self.per)
+
+        if tokens < 1:
+            self.buckets[guild_id] = (tokens, now)
+            return (1 - tokens) * self.per / self.rate
+
+        self.buckets[guild_id] = (tokens - 1, now)
+        return 0
+
+    def _pop(self, guild_id: int):
+        queue = self.queues[guild_id]
+        key = queue.popleft()
+        if queue:
+            self.queues.move_to_end(guild_id)
+        else:
+            del self.queues[guild_id]
+
+        self.depth -= 1
+        return key, self.pending.pop(key)
+
+    async def run(self):
+        while True:
+            if not self.queues:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            self.wakeup.clear()
+            dispatched = False
+            next_delay = self.per
+
+            for guild_id in list(self.queues):
+                now = time.monotonic()
+
+                key = self.queues[guild_id][0]
+                entry = self.pending[key]
+
+                if not entry.changes:
+                    self._pop(guild_id)
+                    entry.finish()
+                    dispatched = True
+                    continue
+
+                ready_in = entry.submitted_at + self.delay - now
+                if ready_in > 0:
+                    next_delay = min(next_delay, ready_in)
+                    continue
+
+                if key in self.running:
+                    continue
+
+                delay = self._take_token(guild_id, now)
+                if delay:
+                    next_delay = min(next_delay, delay)
+                    continue
+
+                key, entry = self._pop(guild_id)
+
+                await self.semaphore.acquire()
+                self.wait_times.append(time.monotonic() - entry.submitted_at)
+                self.running.add(key)
+                self.bot.loop.create_task(self._run_entry(key, entry))
+                dispatched = True
+
+            if not dispatched:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=next_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _run_entry(self, key, entry: PendingChange):
+        try:
+            await self.apply(*key, entry.changes, entry.roles)
+        except Exception:
+            await self.bot.on_error("role_scheduler", *key, entry.changes)
+        finally:
+            entry.finish()
+            self.processed += 1
+            self.running.discard(key)
+            self.semaphore.release()
+            self.wakeup.set()
+
+    def stats(self):
+        wait_times = sorted(self.wait_times)
+
+        return {
+            "depth": self.depth,
+            "guilds": len(self.queues),
+            "max_guild_depth": max(map(len, self.queues.values()), default=0),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "average_wait": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            "median_wait": wait_times[len(wait_times) // 2] if wait_times else 0.0,
+            "max_wait": wait_times[-1] if wait_times else 0.0,
+        }
@@ -0,0 +1,153 @@
+import discord
+from discord.ext import commands
+
+from bot import queries
+
+queries.register(
+    "gateway_session.take",
+    """
+    DELETE FROM gateway_session
+    WHERE shard_id = any($1::int[])
+    RETURNING shard_id, shard_count, session_id, sequence,
+    saved_at > now() - make_interval(secs => $2::float) AS fresh
+    """,
+)
+queries.register(
+    "gateway_session.save",
+    """
+    INSERT INTO gateway_session (shard_id, shard_count, session_id, sequence)
+    SELECT * FROM unnest($1::int[], $2::int[], $3::text[], $4::bigint[])
+    ON CONFLICT (shard_id) DO UPDATE
+    SET shard_count = EXCLUDED.shard_count,
+    session_id = EXCLUDED.session_id,
+    sequence = EXCLUDED.sequence,
+    saved_at = now()
+    """,
+)
+
+
+class SessionStore:
+    """Keeps gateway sessions across restarts so shards can resume them.
+
+    On shutdown every shard's websocket is closed with a non-1000 code, which
+    leaves the session resumable, and its session ID and sequence are saved.
+    On start the saved sessions are taken (and deleted, so a crash loop never
+    retries a stale one) and handed to `DiscordWebSocket.from_client` by the
+    patch in `bot.patches`. A rejected resume falls back to identify through
+    discord.py's invalid session handling.
+
+    This only replays the events missed while restarting, it doesn't make
+    startup faster. A resumed shard has no guild state, as READY is only
+    sent after identify. Once Discord reports the resume complete, the shard
+    waits for an identify slot while still receiving events and is then
+    re-identified to rebuild its guild cache, so startup is still bound by
+    the identify rate limit. Until then, channel and role deletions can't be
+    parsed by discord.py and are dispatched as `raw_guild_channel_delete`
+    and `raw_guild_role_delete` with the guild and deleted object's IDs.
+    """
+
+    uncached_deletes = {
+        "CHANNEL_DELETE": ("raw_guild_channel_delete", "id"),
+        "GUILD_ROLE_DELETE": ("raw_guild_role_delete", "role_id"),
+    }
+
+    close_code = 4000
+    max_age = 120.0
+
+    def __init__(self, bot: commands.AutoShardedBot):
+        self.bot = bot
+        self.attach(bot)
+
+        self.sessions = None
+        self.cold_shards = set()
+        self.granted_identifies = set()
+
+    def attach(self, bot: commands.AutoShardedBot):
+        bot.add_listener(self.on_shard_connect)
+        bot.add_listener(self.on_shard_resumed)
+        bot.add_listener(self.on_socket_response)
+
+    async def load(self):
+        shard_ids = self.bot.shard_ids or range(self.bot.shard_count)
+        rows = await self.bot.queries.fetch(
+            "gateway_session.take", list(shard_ids), self.max_age
+        )
+
+        self.sessions = {
+            row["shard_id"]: (row["session_id"], row["sequence"])
+            for row in rows
+            if row["fresh"] and row["shard_count"] == self.bot.shard_count
+        }
+
+    async def take(self, shard_id: int):
+        if self.sessions is None:
+            await self.load()
+
+        session = self.sessions.pop(shard_id, None)
+        if session is None:
+            return None
+
+        state = self.bot._connection
+        if state.user is None:
+            data = await self.bot.http.get_user("@me")
+            state.user = discord.ClientUser(state=state, data=data)
+            self.bot.prefixes.set_user(state.user.id)
+
+        self.cold_shards.add(shard_id)
+        return session
+
+    async def save(self):
+        sessions = []
+
+        for shard_id, shard in self.bot.shards.items():
+            ws = shard._parent.ws
+            if shard_id in self.cold_shards or not ws.session_id:
+                continue
+
+            shard._parent._cancel_task()
+            await ws.close(code=self.close_code)
+            sessions.append((shard_id, ws.session_id, ws.sequence))
+
+        if not sessions:
+            return
+
+        shard_ids, session_ids, sequences = zip(*sessions)
+        await self.bot.queries.execute(
+            "gateway_session.save",
+            shard_ids,
+            [self.bot.shard_count] * len(shard_ids),
+            session_ids,
+            sequences,
+        )
+
+    def consume_identify(self, shard_id: int):
+        if shard_id not in self.granted_identifies:
+            return False
+
+        self.granted_identifies.discard(shard_id)
+        return True
+
+    async def on_socket_response(self, payload):
+        if payload.get("t") not in self.uncached_deletes:
+            return
+
+        data = payload["d"]
+        guild_id = data.get("guild_id")
+        if guild_id is None or self.bot.get_guild(int(guild_id)):
+            return
+
+        event, key = self.uncached_deletes[payload["t"]]
+        self.bot.dispatch(event, int(guild_id), int(data[key]))
+
+    async def on_shard_connect(self, shard_id: int):
+        self.cold_shards.discard(shard_id)
+
+    async def on_shard_resumed(self, shard_id: int):
+        if shard_id not in self.cold_shards:
+            return
+
+        await self.bot.before_identify_hook(shard_id)
+
+        self.cold_shards.discard(shard_id)
+        self.granted_identifies.add(shard_id)
+        await self.bot.get_shard(shard_id).reconnect()
@@ -1,4 +1,3 @@
-import re
 from typing import Optional, Union
 
 from discord.ext import commands
@@ -21,7 +20,7 @@ def wrap_in_code(value: str, *, block: Optional[Union[bool, str]] = None):
 
 
 def get_clean_prefix(ctx: cmd.Context):
-    if re.match(f"<@!?{ctx.me.id}>", ctx.prefix):
+    if ctx.bot.prefixes.is_mention(ctx.prefix.rstrip()):
         return f"@{ctx.me.display_name} "
 
     return ctx.prefix
@@ -0,0 +1,86 @@
+import asyncio
+import queue as queues
+
+import discord
+from discord.ext import commands
+
+forwarded_events = frozenset(
+    (
+        "MESSAGE_REACTION_ADD",
+        "MESSAGE_REACTION_REMOVE",
+        "MESSAGE_DELETE",
+        "MESSAGE_DELETE_BULK",
+    )
+)
+
+
+class EventForwarder:
+    """Gateway side of the split, forwards raw guild events to worker queues.
+
+    Events are routed by guild so all events of a guild are handled in order
+    by the same worker.
+    """
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    def attach(self, bot: commands.Bot):
+        bot.add_listener(self.on_socket_response)
+
+    async def on_socket_response(self, payload):
+        if payload.get("t") not in forwarded_events:
+            return
+
+        data = payload["d"]
+        guild_id = data.get("guild_id")
+        if guild_id is None:
+            return
+
+        self.queues[int(guild_id) % len(self.queues)].put((payload["t"], data))
+
+
+def dispatch(bot: commands.Bot, event: str, data):
+    if event in ("MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE"):
+        guild_id = int(data["guild_id"])
+        emoji = data["emoji"]
+
+        roles = None
+        if "member" in data:
+            roles = {int(role_id) for role_id in data["member"]["roles"]}
+            roles.discard(guild_id)
+
+        bot.dispatch(
+            "reaction_toggle",
+            guild_id,
+            int(data["message_id"]),
+            int(data["user_id"]),
+            str(emoji["id"] or emoji["name"]),
+            event == "MESSAGE_REACTION_ADD",
+            roles,
+        )
+    elif event == "MESSAGE_DELETE":
+        bot.dispatch("raw_message_delete", discord.RawMessageDeleteEvent(data))
+    elif event == "MESSAGE_DELETE_BULK":
+        bot.dispatch("raw_bulk_message_delete", discord.RawBulkMessageDeleteEvent(data))
+
+
+def get_event(queue, timeout: float):
+    try:
+        return queue.get(timeout=timeout)
+    except queues.Empty:
+        return None
+
+
+async def consume(bot: commands.Bot, queue, *, poll_interval: float = 0.5):
+    """Dispatches events forwarded by gateway processes until the bot closes
+
+    The queue is polled so the executor thread blocked on it never outlives
+    this coroutine by more than `poll_interval`.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    while not bot.is_closed():
+        item = await loop.run_in_executor(None, get_event, queue, poll_interval)
+        if item is not None:
+            dispatch(bot, *item)
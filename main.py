@@ -1,8 +1,10 @@
+import asyncio
 import os
 
 import dotenv
 
 import bot
+from bot import cluster, workers
 
 dotenv.load_dotenv()
 
@@ -10,10 +12,46 @@ os.environ.setdefault("JISHAKU_HIDE", "true")
 os.environ.setdefault("JISHAKU_NO_UNDERSCORE", "true")
 
 
-def main():
-    app = bot.Bot()
+def run_cluster(cluster_id, shard_ids, shard_count, link):
+    app = bot.Bot(
+        shard_ids=list(shard_ids),
+        shard_count=shard_count,
+        cluster=link,
+        forwarder=workers.EventForwarder(link.worker_queues)
+        if link.worker_queues
+        else None,
+    )
     app.run(os.environ.get("DISCORD_TOKEN"))
 
 
+def run_worker(worker_id, queue):
+    app = bot.Bot(worker_id=worker_id)
+    app.loop.run_until_complete(
+        app.start_worker(os.environ.get("DISCORD_TOKEN"), queue)
+    )
+
+
+def main():
+    cluster_count = int(os.environ.get("CLUSTER_COUNT", 1))
+    worker_count = int(os.environ.get("WORKER_COUNT", 0))
+    if cluster_count <= 1 and worker_count <= 0:
+        app = bot.Bot()
+        app.run(os.environ.get("DISCORD_TOKEN"))
+        return
+
+    gateway = asyncio.run(cluster.get_gateway_bot(os.environ.get("DISCORD_TOKEN")))
+    shard_count = int(os.environ.get("SHARD_COUNT") or gateway["shards"])
+
+    supervisor = cluster.Supervisor(
+        run_cluster,
+        shard_count,
+        cluster_count,
+        worker_target=run_worker,
+        worker_count=worker_count,
+        max_concurrency=gateway["session_start_limit"]["max_concurrency"],
+    )
+    supervisor.run()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,11 @@
+CREATE INDEX reaction_role_message_id_emoji_id_idx
+ON reaction_role (message_id, emoji_id) INCLUDE (role_id);
+
+CREATE INDEX reaction_role_guild_id_message_id_idx
+ON reaction_role (guild_id, message_id) INCLUDE (channel_id, role_id, emoji_id);
+
+CREATE INDEX reaction_role_channel_id_idx
+ON reaction_role (channel_id);
+
+CREATE INDEX reaction_role_role_id_idx
+ON reaction_role (role_id);
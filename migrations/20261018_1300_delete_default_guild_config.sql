@@ -0,0 +1,7 @@
+DELETE FROM guild_config
+WHERE prefix = 'd.'
+AND sensitive = false
+AND NOT EXISTS (
+  SELECT FROM reaction_role
+  WHERE reaction_role.guild_id = guild_config.guild_id
+);
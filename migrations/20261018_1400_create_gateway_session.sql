@@ -0,0 +1,7 @@
+CREATE TABLE gateway_session (
+  shard_id INTEGER NOT NULL PRIMARY KEY,
+  shard_count INTEGER NOT NULL,
+  session_id TEXT NOT NULL,
+  sequence BIGINT NOT NULL,
+  saved_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
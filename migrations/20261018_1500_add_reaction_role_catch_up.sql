@@ -0,0 +1,3 @@
+ALTER TABLE reaction_role
+ADD reaction_count INTEGER,
+ADD catch_up_after BIGINT;